@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import csv
+import glob
+import os
+import re
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import tempmodel2 as tm
+
+PARAMS = ("w", "h", "t", "a", "b", "x", "y", "lx", "ly", "el_size_factor")
+
+DEFAULT_MARKERS = (80, 85, 90, 95)
+
+def find_results(jobs_dir="."):
+    """Resultatfiler job_N/temp_model_results_N.{json,npz} sorterade på N."""
+
+    results = []
+
+    pattern = os.path.join(jobs_dir, "job_*", "temp_model_results_*")
+
+    for filename in glob.glob(pattern):
+        match = re.fullmatch(
+            r"temp_model_results_(\d+)\.(json|npz)", os.path.basename(filename)
+        )
+        if match:
+            results.append((int(match.group(1)), filename))
+
+    return [filename for job, filename in sorted(results)]
+
+def columns(markers=DEFAULT_MARKERS):
+    """Kolumnnamn i sammanställningen."""
+
+    return (
+        ["job", "filename"] + list(PARAMS) +
+        ["n_nodes", "n_elements", "a_min", "a_max", "a_mean",
+         "max_flow_max", "max_flow_mean"] +
+        ["heat_flux_%d" % marker for marker in markers]
+    )
+
+def summarize(filename, markers=DEFAULT_MARKERS):
+    """Läs en resultatfil och returnera en rad med parametrar och nyckeltal.
+
+    Värmeflödet genom en markerad rand är summan av reaktionerna r i
+    randens frihetsgrader. Saknas bdofs i filen (äldre resultat) blir
+    det NaN. .npz-filer minnesmappas så att bara de arrayer som behövs
+    läses in.
+    """
+
+    temp_model = tm.TempModel()
+    temp_model.load(filename, mmap_mode="r")
+
+    input_data = temp_model.input_data
+    output_data = temp_model.output_data
+
+    match = re.search(r"(\d+)\.\w+$", filename)
+
+    row = {
+        "job": int(match.group(1)) if match else -1,
+        "filename": filename
+    }
+
+    input_data_dict = input_data.to_dict()
+
+    for name in PARAMS:
+        row[name] = input_data_dict[name]
+
+    a = np.asarray(output_data.a).ravel()
+    max_flow = np.asarray(output_data.max_flow).ravel()
+    r = np.asarray(output_data.r).ravel()
+
+    row["n_nodes"] = np.asarray(output_data.coords).shape[0]
+    row["n_elements"] = np.asarray(output_data.edof).shape[0]
+    row["a_min"] = a.min()
+    row["a_max"] = a.max()
+    row["a_mean"] = a.mean()
+    row["max_flow_max"] = max_flow.max()
+    row["max_flow_mean"] = max_flow.mean()
+
+    bdofs = output_data.bdofs or {}
+
+    for marker in markers:
+        if marker in bdofs:
+            row["heat_flux_%d" % marker] = r[np.asarray(bdofs[marker])-1].sum()
+        else:
+            row["heat_flux_%d" % marker] = np.nan
+
+    return {name: float(value) if isinstance(value, np.floating) else value
+            for name, value in row.items()}
+
+def summarize_all(filenames, markers=DEFAULT_MARKERS, n_workers=1):
+    """Generator som ger en rad per fil i ordning.
+
+    Med n_workers > 1 läses filerna parallellt i en processpool. Högst
+    en fil per arbetare är inläst samtidigt.
+    """
+
+    if n_workers <= 1:
+        for filename in filenames:
+            yield summarize(filename, markers)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for start in range(0, len(filenames), n_workers):
+            batch = filenames[start:start + n_workers]
+            futures = [
+                pool.submit(summarize, filename, markers) for filename in batch
+            ]
+            for future in futures:
+                yield future.result()
+
+def write_csv(filename, rows, markers=DEFAULT_MARKERS):
+    """Skriv raderna till en CSV-fil allteftersom de kommer."""
+
+    n_rows = 0
+
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, columns(markers))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            n_rows += 1
+
+    return n_rows
+
+def write_npz(filename, rows, markers=DEFAULT_MARKERS):
+    """Skriv raderna kolumnvis till en .npz-fil, en array per kolumn."""
+
+    data = {name: [] for name in columns(markers)}
+
+    for row in rows:
+        for name in data:
+            data[name].append(row[name])
+
+    np.savez(filename, **{name: np.asarray(values)
+                          for name, values in data.items()})
+
+    return len(data["job"])
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Collect job_N/temp_model_results_N files into one table."
+    )
+    parser.add_argument(
+        "output", nargs="?", default="summary.csv",
+        help="summary file, .csv or .npz (default: summary.csv)"
+    )
+    parser.add_argument("--jobs-dir", default=".")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes reading result files"
+    )
+    parser.add_argument(
+        "--markers", type=int, nargs="+", default=list(DEFAULT_MARKERS),
+        help="boundary markers to compute heat flux for"
+    )
+    args = parser.parse_args()
+
+    filenames = find_results(args.jobs_dir)
+
+    if not filenames:
+        print("No result files found in %s." % args.jobs_dir)
+        sys.exit(1)
+
+    print("Collecting %d result files..." % len(filenames))
+
+    rows = summarize_all(filenames, args.markers, args.workers)
+
+    if args.output.lower().endswith(".npz"):
+        n_rows = write_npz(args.output, rows, args.markers)
+    else:
+        n_rows = write_csv(args.output, rows, args.markers)
+
+    print("Wrote %d rows to %s." % (n_rows, args.output))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = (
+    "matplotlib", "tabulate", "pyvtk", "gmsh", "calfem.vis_mpl",
+    "calfem.mesh", "calfem.utils", "scipy"
+)
+
+CASES = {
+    "import": "import tempmodel2 as tm",
+    "input_data": "import tempmodel2 as tm; tm.TempModel().input_data.to_dict()",
+    "report": "import tempmodel2 as tm; tm.Report"
+}
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+exec(%r)
+elapsed = time.perf_counter() - t0
+loaded = [m for m in %r if m in sys.modules]
+print(json.dumps({"elapsed": elapsed, "loaded": loaded}))
+"""
+
+def measure(statement, repeat=5, python=sys.executable):
+    """Mät importtiden för statement i nya processer, bästa av repeat."""
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH", "")]
+    )
+
+    best = None
+
+    for i in range(repeat):
+        output = subprocess.check_output(
+            [python, "-c", PROBE % (statement, HEAVY_MODULES)], env=env,
+            universal_newlines=True
+        )
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["elapsed"] < best["elapsed"]:
+            best = result
+
+    return best
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Measure import time of tempmodel2 in fresh processes."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    for name, statement in CASES.items():
+        try:
+            result = measure(statement, args.repeat, args.python)
+        except subprocess.CalledProcessError:
+            print("%-12s failed" % name)
+            continue
+
+        print("%-12s %8.3f s  heavy modules: %s" % (
+            name, result["elapsed"], ", ".join(result["loaded"]) or "-"
+        ))
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import tempmodel2 as tm
+
+DEFAULT_SIZES = (0.1, 0.05, 0.02, 0.01, 0.005)
+
+def run_point(el_size_factor, repeat=3, linear_solver="direct"):
+    """Kör Solver.execute repeat gånger för en elementstorlek.
+
+    Returnerar den snabbaste körningen med antal frihetsgrader och
+    element, tider per fas och maximalt RSS för processen.
+    """
+
+    best = None
+
+    for i in range(repeat):
+        temp_model = tm.TempModel()
+        temp_model.input_data.el_size_factor = el_size_factor
+
+        solver = tm.Solver(temp_model.input_data, temp_model.output_data)
+        solver.linear_solver = linear_solver
+        solver.execute()
+
+        timings = temp_model.output_data.timings
+
+        if best is None or timings["wall"] < best["wall"]:
+            best = {
+                "el_size_factor": el_size_factor,
+                "n_dofs": int(solver.K.shape[0]),
+                "n_elements": int(solver.edof.shape[0]),
+                "wall": timings["wall"],
+                "cpu": timings["cpu"],
+                "phases": {
+                    phase["phase"]: phase["wall"]
+                    for phase in timings["phases"]
+                }
+            }
+
+    best["peak_rss_mb"] = tm.peak_rss_mb()
+
+    return best
+
+def run_benchmark(sizes=DEFAULT_SIZES, repeat=3, linear_solver="direct"):
+    """Kör alla elementstorlekar, var och en i en ny process.
+
+    En ny process per storlek gör att peak_rss_mb gäller just den
+    storleken och inte den största hittills.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    for el_size_factor in sizes:
+        print("Running el_size_factor = %g..." % el_size_factor)
+        sys.stdout.flush()
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(
+                run_point, el_size_factor, repeat, linear_solver
+            ).result()
+
+        print("  %d dofs, %d elements, %.3f s, %s MB"
+              % (result["n_dofs"], result["n_elements"], result["wall"],
+                 result["peak_rss_mb"]))
+
+        results.append(result)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "slurm_job_id": os.environ.get("SLURM_JOB_ID"),
+        "linear_solver": linear_solver,
+        "repeat": repeat,
+        "results": results
+    }
+
+def compare(benchmark, baseline, threshold=0.2, min_time=0.05):
+    """Jämför mot en baslinje och returnera en lista med regressioner.
+
+    En tid räknas som regression om den är mer än threshold (relativt)
+    och min_time sekunder långsammare än baslinjen, minnet om det är mer
+    än threshold större. Storlekar som saknas i baslinjen hoppas över.
+    """
+
+    baseline_results = {
+        result["el_size_factor"]: result for result in baseline["results"]
+    }
+
+    regressions = []
+
+    def check(el_size_factor, name, value, base_value, min_diff):
+        if value is None or base_value is None or base_value <= 0.0:
+            return
+        if value > base_value*(1.0 + threshold) and \
+                value - base_value > min_diff:
+            regressions.append(
+                "el_size_factor = %g, %s: %.3f -> %.3f (%+.0f%%)"
+                % (el_size_factor, name, base_value, value,
+                   100.0*(value/base_value - 1.0))
+            )
+
+    for result in benchmark["results"]:
+        base = baseline_results.get(result["el_size_factor"])
+
+        if base is None:
+            continue
+
+        el_size_factor = result["el_size_factor"]
+
+        check(el_size_factor, "wall", result["wall"], base["wall"], min_time)
+
+        for phase, value in result["phases"].items():
+            check(el_size_factor, phase, value, base["phases"].get(phase),
+                  min_time)
+
+        check(el_size_factor, "peak_rss_mb", result["peak_rss_mb"],
+              base["peak_rss_mb"], 0.0)
+
+    return regressions
+
+def print_table(benchmark):
+    phases = []
+    for result in benchmark["results"]:
+        phases += [name for name in result["phases"] if name not in phases]
+
+    print("%10s %9s %9s %9s %9s" % (
+        "el_size", "dofs", "elements", "wall [s]", "rss [MB]"
+    ) + "".join(" %13s" % name for name in phases))
+
+    for result in benchmark["results"]:
+        print("%10g %9d %9d %9.3f %9.0f" % (
+            result["el_size_factor"], result["n_dofs"], result["n_elements"],
+            result["wall"], result["peak_rss_mb"] or 0.0
+        ) + "".join(
+            " %13.3f" % result["phases"].get(name, 0.0) for name in phases
+        ))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark Solver.execute over a ladder of mesh sizes."
+    )
+    parser.add_argument(
+        "--sizes", type=float, nargs="+", default=list(DEFAULT_SIZES),
+        help="el_size_factor values (default: %s)"
+        % " ".join(str(size) for size in DEFAULT_SIZES)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--solver", choices=("direct", "cg"), default="direct")
+    parser.add_argument(
+        "--output", default="benchmark.json",
+        help="where to write the results"
+    )
+    parser.add_argument(
+        "--baseline", default=None,
+        help="baseline JSON to compare with, exits with status 1 on "
+        "regressions"
+    )
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument(
+        "--min-time", type=float, default=0.05,
+        help="ignore time differences smaller than this (s)"
+    )
+    args = parser.parse_args()
+
+    benchmark = run_benchmark(args.sizes, args.repeat, args.solver)
+
+    with open(args.output, "w") as f:
+        json.dump(benchmark, f, indent=4)
+
+    print_table(benchmark)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        regressions = compare(
+            benchmark, baseline, args.threshold, args.min_time
+        )
+
+        if regressions:
+            print("Regressions against %s:" % args.baseline)
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+
+        print("No regressions against %s." % args.baseline)
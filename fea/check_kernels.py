@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import numpy as np
+
+import calfem.core as cfc
+
+import tempmodel2 as tm
+
+def distorted_quads(n_elements, distortion=0.25, seed=0):
+    """Slumpmässigt förvrängda, konvexa 4-nodselement ex, ey (nel, 4)."""
+
+    rng = np.random.default_rng(seed)
+
+    ex = np.array([0.0, 1.0, 1.0, 0.0]) + \
+        rng.uniform(-distortion, distortion, (n_elements, 4))
+    ey = np.array([0.0, 0.0, 1.0, 1.0]) + \
+        rng.uniform(-distortion, distortion, (n_elements, 4))
+
+    scale = rng.uniform(0.01, 2.0, (n_elements, 1))
+
+    return ex*scale, ey*scale
+
+def check(n_elements=50, seed=0):
+    """Jämför flw2i4e_batch och flw2i4s_batch med cfc elementvis.
+
+    Returnerar största relativa avvikelse per kontroll som en lista med
+    (namn, avvikelse).
+    """
+
+    rng = np.random.default_rng(seed)
+
+    ex, ey = distorted_quads(n_elements, seed=seed)
+    ed = rng.uniform(-100.0, 100.0, (n_elements, 4))
+
+    D = np.array([[1.7, 0.3], [0.3, 0.6]])
+
+    results = []
+
+    def compare(name, batch, reference):
+        reference = np.asarray(reference)
+        diff = np.abs(batch - reference).max()/max(np.abs(reference).max(),
+                                                    1.0)
+        results.append((name, diff))
+
+    for ir in (1, 2, 3):
+        ep = [0.1, ir]
+
+        Ke = tm.flw2i4e_batch(ex, ey, ep, D)
+        es, et, eci = tm.flw2i4s_batch(ex, ey, ep, D, ed)
+
+        for i in range(n_elements):
+            compare("flw2i4e ir=%d" % ir, Ke[i],
+                    cfc.flw2i4e(ex[i], ey[i], ep, D))
+
+            es_ref, et_ref, eci_ref = cfc.flw2i4s(ex[i], ey[i], ep, D, ed[i])
+
+            compare("flw2i4s es ir=%d" % ir, es[i], es_ref)
+            compare("flw2i4s et ir=%d" % ir, et[i], et_ref)
+            compare("flw2i4s eci ir=%d" % ir, eci[i], eci_ref)
+
+    worst = {}
+    for name, diff in results:
+        worst[name] = max(worst.get(name, 0.0), diff)
+
+    return list(worst.items())
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Check the batched element kernels in tempmodel2 "
+        "against calfem.core."
+    )
+    parser.add_argument("--elements", type=int, default=50)
+    parser.add_argument("--tol", type=float, default=1e-12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+
+    for name, diff in check(args.elements, args.seed):
+        ok = diff <= args.tol
+        failed = failed or not ok
+        print("%-20s %10.2e  %s" % (name, diff, "ok" if ok else "MISMATCH"))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import queue
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+SRUN_COMMAND = ["srun", "-Q", "--exclusive", "--overlap", "-n", "1", "-N", "1"]
+
+WORKER_DONE = "@@done"
+WORKER_TIMINGS = "@@timings"
+
+WARM_COMMAND = (
+    "bash cfpython fe-temp-sim.py --worker --mesh-cache "
+    "--result-cache-dir result_cache --vtk-format binary --vtk-dir vtk"
+)
+
+def find_jobs(jobs_dir="."):
+    """Jobbnummer för alla job_N kataloger skapade av setup_jobs.py."""
+
+    jobs = []
+    for name in os.listdir(jobs_dir):
+        match = re.fullmatch(r"job_(\d+)", name)
+        if match and os.path.isdir(os.path.join(jobs_dir, name)):
+            jobs.append(int(match.group(1)))
+
+    return sorted(jobs)
+
+
+class JobFarm:
+    """Kör jobb från en arbetskö med ett fast antal arbetare.
+
+    Varje arbetare tar nästa jobb så fort det föregående är klart, så
+    inga platser står tomma och inga fördröjningar behövs mellan
+    starterna. Backend "local" kör jobben som lokala processer och
+    "slurm" startar varje jobb med srun i den aktuella allokeringen.
+    """
+
+    def __init__(self, command, n_workers=1, backend="local", jobs_dir=".",
+                 status_filename="farm_status.json"):
+        self.command = command
+        self.n_workers = n_workers
+        self.backend = backend
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        self.status_filename = status_filename
+
+        self.status = []
+        self.lock = threading.Lock()
+
+        if backend not in ("local", "slurm"):
+            raise ValueError("Unknown backend: %s" % backend)
+
+    def job_command(self, job):
+        command = [arg.format(job=job) for arg in self.command]
+
+        if self.backend == "slurm":
+            return SRUN_COMMAND + command
+
+        return command
+
+    def log_filename(self, job):
+        return os.path.join(
+            self.jobs_dir,
+            "worker_%s_%d" % (os.environ.get("SLURM_JOB_ID", "local"), job)
+        )
+
+    def env(self):
+        env = dict(os.environ)
+        env.setdefault("SLURM_SUBMIT_DIR", self.jobs_dir)
+        return env
+
+    def run_job(self, worker, job):
+        """Kör ett jobb och returnera en statuspost."""
+
+        start = time.time()
+
+        with open(self.log_filename(job), "w") as log:
+            try:
+                returncode = subprocess.call(
+                    self.job_command(job), cwd=self.jobs_dir, env=self.env(),
+                    stdout=log, stderr=subprocess.STDOUT
+                )
+            except OSError as e:
+                log.write("Could not start job: %s\n" % e)
+                returncode = -1
+
+        end = time.time()
+
+        return self.record(worker, job, returncode, start, end)
+
+    def read_timings(self, job):
+        """Tider per fas från jobbets logg (WORKER_TIMINGS-rad), eller None."""
+
+        timings = None
+
+        try:
+            with open(self.log_filename(job), "r") as log:
+                for line in log:
+                    if line.startswith(WORKER_TIMINGS):
+                        timings = json.loads(line[len(WORKER_TIMINGS):])
+        except (OSError, ValueError):
+            pass
+
+        return timings
+
+    def record(self, worker, job, returncode, start, end):
+        return {
+            "job": job,
+            "worker": worker,
+            "returncode": returncode,
+            "start": start,
+            "end": end,
+            "elapsed": end - start,
+            "timings": self.read_timings(job)
+        }
+
+    def save_status(self):
+        tmp_filename = self.status_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.status, f, indent=4)
+        os.replace(tmp_filename, self.status_filename)
+
+    def stop_worker(self, worker):
+        pass
+
+    def worker(self, worker, job_queue):
+        while True:
+            try:
+                job = job_queue.get_nowait()
+            except queue.Empty:
+                self.stop_worker(worker)
+                return
+
+            record = self.run_job(worker, job)
+
+            with self.lock:
+                self.status.append(record)
+                self.save_status()
+                print("Job %d finished with status %d in %.1f s (%d done)."
+                      % (job, record["returncode"], record["elapsed"],
+                         len(self.status)))
+                sys.stdout.flush()
+
+    def run(self, jobs):
+        """Kör alla jobb och returnera listan med statusposter."""
+
+        job_queue = queue.Queue()
+        for job in jobs:
+            job_queue.put(job)
+
+        threads = [
+            threading.Thread(target=self.worker, args=(i, job_queue))
+            for i in range(min(self.n_workers, len(jobs)))
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return sorted(self.status, key=lambda record: record["job"])
+
+
+class WarmJobFarm(JobFarm):
+    """JobFarm med en långlivad arbetsprocess per plats.
+
+    Arbetsprocessen (fe-temp-sim.py --worker) startas en gång per plats
+    och importerar calfem m.fl. bara en gång. Den får jobbnummer på stdin
+    och svarar med en WORKER_DONE-rad när jobbet är klart. Om processen
+    dör räknas jobbet som misslyckat och en ny process startas.
+    """
+
+    def __init__(self, *args, **kwargs):
+        JobFarm.__init__(self, *args, **kwargs)
+        self.processes = {}
+
+    def start_worker(self):
+        command = list(self.command)
+
+        if self.backend == "slurm":
+            command = SRUN_COMMAND + command
+
+        return subprocess.Popen(
+            command, cwd=self.jobs_dir, env=self.env(), stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True, bufsize=1
+        )
+
+    def stop_worker(self, worker):
+        process = self.processes.pop(worker, None)
+
+        if process is not None:
+            process.stdin.close()
+            process.wait()
+
+    def run_job(self, worker, job):
+        start = time.time()
+        returncode = -1
+
+        with open(self.log_filename(job), "w") as log:
+            try:
+                if worker not in self.processes:
+                    self.processes[worker] = self.start_worker()
+
+                process = self.processes[worker]
+                process.stdin.write("%d\n" % job)
+                process.stdin.flush()
+
+                for line in process.stdout:
+                    if line.startswith(WORKER_DONE):
+                        returncode = int(line.split()[-2])
+                        break
+                    log.write(line)
+                else:
+                    log.write("Worker process exited with status %s\n"
+                              % process.wait())
+                    del self.processes[worker]
+            except OSError as e:
+                log.write("Worker process failed: %s\n" % e)
+                self.processes.pop(worker, None)
+
+        end = time.time()
+
+        return self.record(worker, job, returncode, start, end)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Run the job_N directories created by setup_jobs.py."
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.environ.get("SLURM_NTASKS", os.cpu_count())),
+        help="number of concurrent jobs (default: $SLURM_NTASKS)"
+    )
+    parser.add_argument(
+        "--backend", choices=("local", "slurm"), default="local"
+    )
+    parser.add_argument(
+        "--command", default=None,
+        help="command per job, {job} is replaced with the job number "
+        "(default: 'bash work_script.sh {job}')"
+    )
+    parser.add_argument(
+        "--warm", action="store_true",
+        help="keep one worker process per slot and send it job numbers "
+        "on stdin, --command then starts the worker (default: '%s')"
+        % WARM_COMMAND
+    )
+    parser.add_argument("--jobs-dir", default=".")
+    parser.add_argument("--status", default="farm_status.json")
+    args = parser.parse_args()
+
+    jobs = find_jobs(args.jobs_dir)
+
+    print("Running %d jobs on %d workers (%s)..."
+          % (len(jobs), args.workers, args.backend))
+
+    if args.warm:
+        farm_class = WarmJobFarm
+        command = args.command or WARM_COMMAND
+    else:
+        farm_class = JobFarm
+        command = args.command or "bash work_script.sh {job}"
+
+    farm = farm_class(
+        shlex.split(command), args.workers, args.backend, args.jobs_dir,
+        args.status
+    )
+
+    t0 = time.time()
+    status = farm.run(jobs)
+
+    failed = [record["job"] for record in status if record["returncode"] != 0]
+
+    print("Completed %d jobs in %.1f s, %d failed."
+          % (len(status), time.time() - t0, len(failed)))
+
+    if failed:
+        print("Failed jobs: %s" % " ".join(str(job) for job in failed))
+        sys.exit(1)
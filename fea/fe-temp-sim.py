@@ -1,18 +1,22 @@
 # -*- coding: utf-8 -*-
 
-import os, sys
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import traceback
 
 import tempmodel2 as tm
+import model_cache as mc
+import vtk_writer as vw
 
-if __name__ == "__main__":
+from farm import WORKER_DONE, WORKER_TIMINGS
 
-    if len(sys.argv)==4:
-        input_filename = sys.argv[1]
-        output_filename = sys.argv[2]
-        vtk_filename = sys.argv[3]
-    else:
-        print("Usage: "+sys.argv[0]+" input_filename output_filename vtk_filename")
-        sys.exit(1)
+def solve(input_filename, output_filename, vtk_filename, args, mesh_cache,
+          result_cache=None):
+    """Lös en modell och spara resultat och VTK-fil."""
 
     print("Creating empty model...")
     temp_model = tm.TempModel()
@@ -20,13 +24,176 @@ if __name__ == "__main__":
     temp_model.input_data.el_size_factor = 0.05
 
     print("Solving model...")
-    temp_solver = tm.Solver(temp_model.input_data, temp_model.output_data)
+    temp_solver = tm.Solver(
+        temp_model.input_data, temp_model.output_data, mesh_cache
+    )
+    temp_solver.linear_solver = args.solver
+    temp_solver.preconditioner = args.preconditioner
+    temp_solver.result_cache = result_cache
     temp_solver.execute()
 
     print("Saving results")
-    temp_model.save(output_filename)
-    temp_model.output_data.export_vtk(vtk_filename)
+    with temp_solver.timer.phase("save"):
+        temp_model.save(output_filename, compressed=not args.uncompressed)
+
+    temp_solver.vtk_format = args.vtk_format
+    temp_solver.export_vtk(vtk_filename)
+
+    if args.vtk_dir is not None:
+        os.makedirs(args.vtk_dir, exist_ok=True)
+        shutil.copy(vtk_filename, args.vtk_dir)
+
+    # --- Tider per fas, som en rad i loggen och eventuellt som fil
+
+    timings = temp_model.output_data.timings
+
+    print("Total %.2f s wall, %.2f s CPU, peak RSS %s MB" % (
+        timings["wall"], timings["cpu"], timings["peak_rss_mb"]
+    ))
+    print("%s %s" % (WORKER_TIMINGS, json.dumps(timings)))
+
+    if args.timings is not None:
+        temp_solver.save_timings("%s_timings.%s" % (
+            os.path.splitext(output_filename)[0], args.timings
+        ))
+
+def job_filenames(line):
+    """Filnamn för en rad i jobblistan, ett jobbnummer eller tre filnamn."""
+
+    fields = line.split()
+
+    if len(fields) == 3:
+        return fields
+
+    job = int(fields[0])
+    job_dir = "job_%d" % job
+
+    return [
+        os.path.join(job_dir, "temp_model_%d.json" % job),
+        os.path.join(job_dir, "temp_model_results_%d.json" % job),
+        os.path.join(job_dir, "temp_model_results_%d.vtk" % job)
+    ]
 
+def run_worker(job_list, args, mesh_cache, result_cache=None):
+    """Lös alla jobb i job_list i samma process.
 
+    Efter varje jobb skrivs en rad "@@done <jobb> <status> <tid>" så att
+    en styrande process (farm.py --warm) vet när nästa jobb kan skickas.
+    """
 
+    for line in job_list:
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
 
+        t0 = time.time()
+
+        try:
+            solve(
+                *job_filenames(line), args=args, mesh_cache=mesh_cache,
+                result_cache=result_cache
+            )
+            status = 0
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            status = 1
+
+        print("%s %s %d %.3f" % (WORKER_DONE, line, status, time.time() - t0))
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_filename", nargs="?")
+    parser.add_argument(
+        "output_filename", nargs="?",
+        help="results file, binary if it ends with .npz"
+    )
+    parser.add_argument("vtk_filename", nargs="?")
+    parser.add_argument(
+        "--worker", action="store_true",
+        help="solve many jobs in one process, read from stdin or --job-list"
+    )
+    parser.add_argument(
+        "--job-list", default=None, metavar="FILE",
+        help="jobs for --worker, one job number or 'input output vtk' per line"
+    )
+    parser.add_argument(
+        "--vtk-dir", default=None, metavar="DIR",
+        help="copy the VTK files to this directory"
+    )
+    parser.add_argument(
+        "--mesh-cache", action="store_true",
+        help="reuse meshes from a node local cache"
+    )
+    parser.add_argument(
+        "--mesh-cache-dir", default=None, metavar="DIR",
+        help="mesh cache directory (default: under $SNIC_TMP)"
+    )
+    parser.add_argument(
+        "--mesh-cache-size", type=float, default=1024.0, metavar="MB",
+        help="max size of the mesh cache in MB"
+    )
+    parser.add_argument(
+        "--result-cache", action="store_true",
+        help="reuse results for identical input from a result cache"
+    )
+    parser.add_argument(
+        "--result-cache-dir", default=None, metavar="DIR",
+        help="result cache directory (default: ~/.cache/tempmodel_result_cache)"
+    )
+    parser.add_argument(
+        "--result-cache-size", type=float, default=4096.0, metavar="MB",
+        help="max size of the result cache in MB"
+    )
+    parser.add_argument(
+        "--uncompressed", action="store_true",
+        help="store .npz results uncompressed so they can be memory-mapped"
+    )
+    parser.add_argument(
+        "--vtk-format", choices=vw.VTK_FORMATS, default="ascii",
+        help="ascii (pyvtk), binary legacy VTK or vtu (XML, raw appended)"
+    )
+    parser.add_argument(
+        "--solver", choices=("direct", "cg"), default="direct",
+        help="sparse LU or preconditioned conjugate gradients"
+    )
+    parser.add_argument(
+        "--preconditioner", choices=("auto", "amg", "ic", "jacobi", "none"),
+        default="auto", help="CG preconditioner, auto uses amg if pyamg exists"
+    )
+    parser.add_argument(
+        "--timings", choices=("json", "csv"), default=None,
+        help="write per-phase timings next to the results file"
+    )
+    args = parser.parse_args()
+
+    if not args.worker and args.vtk_filename is None:
+        parser.error("input_filename, output_filename and vtk_filename "
+                     "are required unless --worker is given")
+
+    mesh_cache = None
+
+    if args.mesh_cache or args.mesh_cache_dir is not None:
+        mesh_cache = mc.MeshCache(
+            args.mesh_cache_dir, int(args.mesh_cache_size*1024**2)
+        )
+
+    result_cache = None
+
+    if args.result_cache or args.result_cache_dir is not None:
+        result_cache = mc.ResultCache(
+            args.result_cache_dir, int(args.result_cache_size*1024**2)
+        )
+
+    if args.worker:
+        if args.job_list is not None:
+            with open(args.job_list, "r") as job_list:
+                run_worker(job_list, args, mesh_cache, result_cache)
+        else:
+            run_worker(sys.stdin, args, mesh_cache, result_cache)
+    else:
+        solve(
+            args.input_filename, args.output_filename, args.vtk_filename,
+            args, mesh_cache, result_cache
+        )
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+MESH_CACHE_VERSION = 1
+RESULT_CACHE_VERSION = 1
+
+# Fält i InputData.to_dict() som bara styr parameterstudier och inte
+# påverkar lösningen för en punkt, ingår inte i resultatnyckeln.
+
+STUDY_KEYS = (
+    "a_end", "b_end", "param_filename", "param_steps", "param_a", "param_b"
+)
+
+def default_cache_dir(name):
+    """Katalog för cachen, på nodlokal disk om den finns ($SNIC_TMP)."""
+
+    base_dir = os.environ.get("SNIC_TMP", tempfile.gettempdir())
+    return os.path.join(base_dir, name)
+
+def hash_key(params):
+    """Skapa en innehållsnyckel från en dict med parametrar."""
+
+    key_str = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Storleksbegränsad cache av NumPy-arrayer i .npz-filer på disk.
+
+    Filerna skrivs atomärt (temporär fil + os.replace) så att flera
+    processer på samma nod kan dela katalogen. Vid träff uppdateras
+    filens mtime och vid överskriden storlek tas de äldsta bort (LRU).
+    """
+
+    def __init__(self, cache_dir, max_size=1024**3):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key):
+        """Returnera en dict med arrayer för key, eller None."""
+
+        filename = self.path(key)
+
+        try:
+            with np.load(filename) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zipfile.BadZipFile):
+            self.remove(key)
+            return None
+
+        return arrays
+
+    def put(self, key, arrays):
+        """Lagra en dict med arrayer under key."""
+
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=self.cache_dir, prefix=".tmp_", suffix=".npz"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_filename, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+        self.evict()
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Ta bort minst nyligen använda poster tills cachen ryms i max_size."""
+
+        entries = []
+        total_size = 0
+
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".npz") or entry.name.startswith("."):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total_size += st.st_size
+
+        entries.sort()
+
+        for _, size, filename in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+class MeshCache(DiskCache):
+    """Cache för genererade nät (coords, edof, dofs, bdofs)."""
+
+    def __init__(self, cache_dir=None, max_size=1024**3):
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                "TEMPMODEL_MESH_CACHE", default_cache_dir("tempmodel_mesh_cache")
+            )
+
+        DiskCache.__init__(self, cache_dir, max_size)
+
+    def key(self, input_data, el_type, dofs_per_node):
+        """Nyckel baserad på geometriparametrar och elementstorlek."""
+
+        return hash_key({
+            "version": MESH_CACHE_VERSION,
+            "w": input_data.w,
+            "h": input_data.h,
+            "a": input_data.a,
+            "b": input_data.b,
+            "x": input_data.x,
+            "y": input_data.y,
+            "el_size_factor": input_data.el_size_factor,
+            "el_type": el_type,
+            "dofs_per_node": dofs_per_node
+        })
+
+    def load(self, key):
+        """Returnera (coords, edof, dofs, bdofs) eller None."""
+
+        arrays = self.get(key)
+
+        if arrays is None:
+            return None
+
+        bdofs = {}
+        for name, value in arrays.items():
+            if name.startswith("bdofs_"):
+                bdofs[int(name[6:])] = value.tolist()
+
+        return arrays["coords"], arrays["edof"], arrays["dofs"], bdofs
+
+    def store(self, key, coords, edof, dofs, bdofs):
+        arrays = {
+            "coords": np.asarray(coords),
+            "edof": np.asarray(edof),
+            "dofs": np.asarray(dofs)
+        }
+
+        for marker, marker_dofs in bdofs.items():
+            arrays["bdofs_%d" % marker] = np.asarray(marker_dofs, int)
+
+        self.put(key, arrays)
+
+
+class ResultCache(DiskCache):
+    """Cache för lösta modeller, OutputData.to_arrays() per indata.
+
+    Nyckeln är en hash av InputData.to_dict() (utom STUDY_KEYS), solverns
+    version och ekvationslösaren. Standardkatalogen ligger i hemkatalogen
+    och inte på nodlokal disk, så att resultaten finns kvar mellan jobb.
+    """
+
+    def __init__(self, cache_dir=None, max_size=4*1024**3):
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                "TEMPMODEL_RESULT_CACHE",
+                os.path.join(
+                    os.path.expanduser("~"), ".cache", "tempmodel_result_cache"
+                )
+            )
+
+        DiskCache.__init__(self, cache_dir, max_size)
+
+    def key(self, input_data_dict, solver_version, linear_solver="direct"):
+        params = {
+            name: value for name, value in input_data_dict.items()
+            if name not in STUDY_KEYS
+        }
+
+        return hash_key({
+            "version": RESULT_CACHE_VERSION,
+            "solver_version": solver_version,
+            "linear_solver": linear_solver,
+            "input_data": params
+        })
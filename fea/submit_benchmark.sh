@@ -0,0 +1,22 @@
+#!/bin/sh
+# the benchmark runs on a single task so timings are comparable
+#SBATCH -N 1
+#SBATCH --tasks-per-node=1
+#SBATCH --exclusive
+#
+# job time, the finest mesh sizes dominate
+#SBATCH -t 00:30:00
+#
+# job name and output file names
+#SBATCH -J feaBenchmark
+#SBATCH -o res_feaBenchmark_%j.out
+#SBATCH -e res_feaBenchmark_%j.out
+cat $0
+
+# runs Solver.execute over a ladder of el_size_factor values and writes
+# dofs, elements, per-phase timings and peak memory to benchmark_<jobid>.json
+#
+# compare with a stored baseline by adding --baseline benchmark_baseline.json,
+# the job then exits with status 1 if any phase got slower
+
+bash cfpython benchmark.py --output benchmark_${SLURM_JOB_ID}.json
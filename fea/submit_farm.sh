@@ -0,0 +1,21 @@
+#!/bin/sh
+# requesting the number of nodes needed
+#SBATCH -N 1
+#SBATCH --tasks-per-node=20
+#
+# job time, change for what your job farm requires
+#SBATCH -t 00:30:00
+#
+# job name and output file names
+#SBATCH -J jobFarm
+#SBATCH -o res_jobFarm_%j.out
+#SBATCH -e res_jobFarm_%j.out
+cat $0
+
+# farm.py keeps one job running per task until all job_N directories
+# are done and records exit status and timings in farm_status.json
+#
+# with --warm each task instead starts one fe-temp-sim.py --worker
+# process that imports calfem once and then solves job after job
+
+python3 farm.py --backend slurm --workers $SLURM_NTASKS
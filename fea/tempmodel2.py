@@ -1,21 +1,47 @@
 ﻿# -*- coding: utf-8 -*-
 
+import contextlib
+import csv
+import importlib.util
+import itertools
 import json
-import math
+import os
+import struct
 import sys
+import tempfile
+import time
+import zipfile
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from json import JSONEncoder
 
-import calfem.core as cfc
-import calfem.geometry as cfg
-import calfem.mesh as cfm
-import calfem.vis_mpl as cfv
-import calfem.utils as cfu
+try:
+    import resource
+except ImportError:
+    resource = None
 
 import numpy as np
-import tabulate as tbl
 
-import pyvtk as vtk
+import vtk_writer as vw
+
+# Version av lösningen, öka när ändringar i Solver ger andra resultat så
+# att cachade resultat (model_cache.ResultCache) inte längre används.
+
+SOLVER_VERSION = 1
+
+# calfem, scipy och pyvtk importeras i de funktioner som använder dem så
+# att InputData, TempModel och Solver kan importeras utan dem. Report och
+# Visualisation finns i tempmodel2_report och tempmodel2_vis och laddas
+# först när de används (se __getattr__ nedan).
+
+def __getattr__(name):
+    if name == "Report":
+        import tempmodel2_report
+        return tempmodel2_report.Report
+    if name == "Visualisation":
+        import tempmodel2_vis
+        return tempmodel2_vis.Visualisation
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 class NumpyArrayEncoder(JSONEncoder):
     def default(self, obj):
@@ -31,6 +57,410 @@ def try_convert(value, def_value):
 
     return v
 
+def flw2i4_gauss(ir):
+    """Gausspunkter, vikter och formfunktioner för 4-nods isoparametriska element.
+
+    Returnerar N (ngp, 4), dNr (ngp, 2, 4) och vikter wp (ngp,) i samma
+    ordning som cfc.flw2i4e/cfc.flw2i4s använder.
+    """
+
+    if ir == 1:
+        g = np.array([0.0])
+        w = np.array([2.0])
+    elif ir == 2:
+        g = np.array([-0.577350269189626, 0.577350269189626])
+        w = np.array([1.0, 1.0])
+    elif ir == 3:
+        g = np.array([-0.774596669241483, 0.0, 0.774596669241483])
+        w = np.array([0.555555555555555, 0.888888888888888, 0.555555555555555])
+    else:
+        raise ValueError("Used number of integration points not implemented")
+
+    xsi, eta = [v.ravel() for v in np.meshgrid(g, g)]
+    wp = np.outer(w, w).ravel()
+
+    N = np.column_stack([
+        (1-xsi)*(1-eta), (1+xsi)*(1-eta), (1+xsi)*(1+eta), (1-xsi)*(1+eta)
+    ])/4.
+
+    dNr = np.stack([
+        np.column_stack([-(1-eta), (1-eta), (1+eta), -(1+eta)]),
+        np.column_stack([-(1-xsi), -(1+xsi), (1+xsi), (1-xsi)])
+    ], axis=1)/4.
+
+    return N, dNr, wp
+
+def _flw2i4_b(dNr, ex, ey):
+    """Gradientmatriser B (nel, ngp, 2, 4) och determinanter detJ (nel, ngp)."""
+
+    ex = np.asarray(ex, float)
+    ey = np.asarray(ey, float)
+
+    # JT = dNr @ [ex, ey] per element och gausspunkt, inverteras explicit.
+
+    j11 = ex @ dNr[:, 0, :].T
+    j12 = ey @ dNr[:, 0, :].T
+    j21 = ex @ dNr[:, 1, :].T
+    j22 = ey @ dNr[:, 1, :].T
+
+    detJ = j11*j22 - j12*j21
+
+    B = np.empty(detJ.shape + dNr.shape[1:])
+    B[:, :, 0, :] = (j22[..., None]*dNr[:, 0, :] - j12[..., None]*dNr[:, 1, :])
+    B[:, :, 1, :] = (j11[..., None]*dNr[:, 1, :] - j21[..., None]*dNr[:, 0, :])
+    B /= detJ[..., None, None]
+
+    return B, detJ
+
+def flw2i4e_batch(ex, ey, ep, D):
+    """Beräkna elementmatriser för alla 4-nodselement på en gång.
+
+    ex, ey är (nel, 4) från cfc.coordxtr. Returnerar Ke med formen
+    (nel, 4, 4), elementvis identisk med cfc.flw2i4e.
+    """
+
+    t = ep[0]
+    _, dNr, wp = flw2i4_gauss(ep[1])
+
+    B, detJ = _flw2i4_b(dNr, ex, ey)
+
+    DB = np.asarray(D, float) @ B
+    BtDB = np.swapaxes(B, -1, -2) @ DB
+
+    return t*np.einsum("egij,eg->eij", BtDB, detJ*wp)
+
+def flw2i4s_batch(ex, ey, ep, D, ed):
+    """Beräkna flöden och gradienter för alla 4-nodselement på en gång.
+
+    Returnerar es, et och eci med formen (nel, ngp, 2), där varje element
+    motsvarar resultatet från cfc.flw2i4s.
+    """
+
+    N, dNr, _ = flw2i4_gauss(ep[1])
+
+    B, _ = _flw2i4_b(dNr, ex, ey)
+
+    ed = np.asarray(ed, float)
+
+    et = (B @ ed[:, None, :, None])[..., 0]
+    es = -et @ np.asarray(D, float).T
+
+    eci = np.stack([
+        np.asarray(ex, float) @ N.T, np.asarray(ey, float) @ N.T
+    ], axis=-1)
+
+    return es, et, eci
+
+def coordxtr_batch(edof, coords, dofs):
+    """Elementkoordinater ex, ey (nel, nen), motsvarar cfc.coordxtr."""
+
+    edof = np.asarray(edof)
+    dofs = np.asarray(dofs)
+    coords = np.asarray(coords)
+
+    node_of_dof = np.zeros(dofs.max() + 1, int)
+    node_of_dof[dofs[:, 0]] = np.arange(dofs.shape[0])
+
+    nodes = node_of_dof[edof[:, ::dofs.shape[1]]]
+
+    return coords[nodes, 0], coords[nodes, 1]
+
+def assem_sparse(edof, Ke, n_dofs):
+    """Assemblera elementmatriser Ke (nel, n, n) till en gles CSR-matris."""
+
+    import scipy.sparse as sp
+
+    topo = np.asarray(edof) - 1
+    n_el_dofs = topo.shape[1]
+
+    rows = np.repeat(topo, n_el_dofs, axis=1).ravel()
+    cols = np.tile(topo, (1, n_el_dofs)).ravel()
+
+    K = sp.coo_matrix(
+        (np.asarray(Ke).ravel(), (rows, cols)), shape=(n_dofs, n_dofs)
+    )
+
+    return K.tocsr()
+
+def apply_bcs(bdofs, bcs, loads, n_dofs):
+    """Lastvektor f (n_dofs, 1) samt bc_prescr och bc_val för bcs och loads."""
+
+    import calfem.utils as cfu
+
+    f = np.zeros([n_dofs, 1])
+    bc_prescr = np.array([], int)
+    bc_val = np.array([], float)
+
+    for bc in bcs:
+        bc_prescr, bc_val = cfu.applybc(
+            bdofs, bc_prescr, bc_val, bc[0], bc[1]
+        )
+
+    for load in loads:
+        cfu.applyforcetotal(bdofs, f, load[0], load[1])
+
+    return f, np.asarray(bc_prescr, int), bc_val
+
+
+def reduce_system(K, bc_prescr):
+    """Dela upp K i fria och föreskrivna frihetsgrader.
+
+    Returnerar K (CSR), en mask free för de fria frihetsgraderna samt
+    K_fp (fria rader, föreskrivna kolumner) och K_ff (fria, fria).
+    """
+
+    import scipy.sparse as sp
+
+    K = sp.csr_matrix(K)
+    bc_prescr = np.asarray(bc_prescr, int)
+
+    free = np.ones(K.shape[0], bool)
+    free[bc_prescr-1] = False
+
+    K_free = K[free]
+
+    return K, free, K_free[:, bc_prescr-1], K_free[:, free]
+
+
+class FactorizedSystem:
+    """Systemmatris K reducerad och LU-faktoriserad för givna randvillkor.
+
+    Faktoriseringen beror bara på vilka frihetsgrader som är föreskrivna,
+    så solve kan sedan anropas för godtyckligt många lastvektorer och
+    randvillkorsvärden, kolumnvis som ett block av högerled.
+    """
+
+    def __init__(self, K, bc_prescr):
+        import scipy.sparse.linalg as spla
+
+        self.bc_prescr = np.asarray(bc_prescr, int)
+        self.K, self.free, self.K_fp, K_ff = reduce_system(K, self.bc_prescr)
+        self.lu = spla.splu(K_ff.tocsc())
+
+    def solve(self, f, bc_val):
+        """Lös för f (n_dofs, n_cases) och bc_val (n_prescr, n_cases).
+
+        Returnerar a och r med formen (n_dofs, n_cases).
+        """
+
+        n_dofs = self.K.shape[0]
+
+        f = np.asarray(f, float).reshape(n_dofs, -1)
+        bc_val = np.asarray(bc_val, float).reshape(self.bc_prescr.size, -1)
+
+        a = np.zeros(f.shape)
+        a[self.bc_prescr-1] = bc_val
+
+        fsys = f[self.free] - self.K_fp @ bc_val
+
+        a[self.free] = self.lu.solve(fsys)
+
+        r = self.K @ a - f
+
+        return a, r
+
+def solveq_sparse(K, f, bc_prescr, bc_val):
+    """Lös ett glest ekvationssystem med randvillkor, motsvarar cfc.solveq."""
+
+    return FactorizedSystem(K, bc_prescr).solve(f, bc_val)
+
+def cg_preconditioner(A, preconditioner="auto"):
+    """Förkonditionerare för CG på den reducerade systemmatrisen A.
+
+    preconditioner är "amg" (kräver pyamg), "ic", "jacobi" eller "none".
+    "auto" väljer "amg" om pyamg finns och annars "ic". "ic" är en
+    ofullständig LDL^T-faktorisering, byggd från L-faktorn i spilu utan
+    pivotering så att förkonditioneraren blir symmetrisk som CG kräver.
+    Returnerar förkonditioneraren och namnet på den som valdes.
+    """
+
+    import scipy.sparse as sp
+    import scipy.sparse.linalg as spla
+
+    if preconditioner == "auto":
+        if importlib.util.find_spec("pyamg") is not None:
+            preconditioner = "amg"
+        else:
+            preconditioner = "ic"
+
+    if preconditioner == "amg":
+        import pyamg
+        ml = pyamg.smoothed_aggregation_solver(
+            sp.csr_matrix(A), symmetry="symmetric"
+        )
+        M = ml.aspreconditioner(cycle="V")
+    elif preconditioner == "ic":
+        ilu = spla.spilu(
+            sp.csc_matrix(A), drop_tol=1e-3, fill_factor=10,
+            permc_spec="NATURAL", diag_pivot_thresh=0.0,
+            options={"SymmetricMode": True}
+        )
+        L = sp.csr_matrix(ilu.L)
+        LT = sp.csr_matrix(L.T)
+        d = ilu.U.diagonal()
+
+        def ic_solve(x):
+            y = spla.spsolve_triangular(L, x, lower=True, unit_diagonal=True)
+            return spla.spsolve_triangular(
+                LT, y/d, lower=False, unit_diagonal=True
+            )
+
+        M = spla.LinearOperator(A.shape, ic_solve)
+    elif preconditioner == "jacobi":
+        M = sp.diags(1.0/A.diagonal())
+    elif preconditioner == "none":
+        M = None
+    else:
+        raise ValueError("Unknown preconditioner: %s" % preconditioner)
+
+    return M, preconditioner
+
+def solveq_cg(K, f, bc_prescr, bc_val, x0=None, tol=1e-10,
+              preconditioner="auto", maxiter=None):
+    """Lös systemet med förkonditionerad CG, K ska vara symmetrisk (SPD).
+
+    x0 är en startgissning för alla frihetsgrader (n_dofs,), till exempel
+    lösningen från en närliggande parameterpunkt. Returnerar a, r och en
+    dict med antal iterationer och relativa residualer.
+    """
+
+    import scipy.sparse.linalg as spla
+
+    bc_prescr = np.asarray(bc_prescr, int)
+    bc_val = np.asarray(bc_val, float).reshape(-1, 1)
+
+    K, free, K_fp, K_ff = reduce_system(K, bc_prescr)
+
+    a = np.zeros([K.shape[0], 1])
+    a[bc_prescr-1] = bc_val
+
+    fsys = (f[free] - K_fp @ bc_val).ravel()
+    fsys_norm = np.linalg.norm(fsys) or 1.0
+
+    if x0 is not None:
+        x0 = np.asarray(x0, float).ravel()[free]
+        initial_residual = np.linalg.norm(fsys - K_ff @ x0)/fsys_norm
+    else:
+        initial_residual = 1.0
+
+    M, preconditioner = cg_preconditioner(K_ff, preconditioner)
+
+    iterations = [0]
+
+    def count(xk):
+        iterations[0] += 1
+
+    x, status = spla.cg(
+        K_ff, fsys, x0=x0, rtol=tol, maxiter=maxiter, M=M, callback=count
+    )
+
+    residual = np.linalg.norm(fsys - K_ff @ x)/fsys_norm
+
+    if status != 0:
+        raise RuntimeError(
+            "CG did not converge in %d iterations (residual %g)"
+            % (iterations[0], residual)
+        )
+
+    a[free] = x.reshape(-1, 1)
+
+    r = K @ a - f
+
+    solver_info = {
+        "method": "cg",
+        "preconditioner": preconditioner,
+        "warm_start": x0 is not None,
+        "iterations": iterations[0],
+        "initial_residual": float(initial_residual),
+        "residual": float(residual),
+        "tol": tol
+    }
+
+    return a, r, solver_info
+
+
+def peak_rss_mb():
+    """Processens maximala RSS hittills i MB, None om det inte kan mätas."""
+
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss är i kB på Linux men i byte på macOS
+
+    if sys.platform == "darwin":
+        return max_rss/1024**2
+
+    return max_rss/1024
+
+
+class PhaseTimer:
+    """Mäter väggtid, CPU-tid och maximalt RSS för namngivna faser.
+
+    Varje fas ger en post i phases. peak_rss_mb är processens maximala
+    RSS efter fasen och rss_increase_mb hur mycket det ökade under fasen.
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        rss_start = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        try:
+            yield
+        finally:
+            rss_end = peak_rss_mb()
+
+            self.phases.append({
+                "phase": name,
+                "wall": time.perf_counter() - wall_start,
+                "cpu": time.process_time() - cpu_start,
+                "peak_rss_mb": rss_end,
+                "rss_increase_mb":
+                    None if rss_end is None else rss_end - rss_start
+            })
+
+    def to_dict(self):
+        return {
+            "phases": [dict(phase) for phase in self.phases],
+            "wall": sum(phase["wall"] for phase in self.phases),
+            "cpu": sum(phase["cpu"] for phase in self.phases),
+            "peak_rss_mb": peak_rss_mb()
+        }
+
+def timing_rows(timings, **columns):
+    """Platta ut en timings-dict till en rad per fas, med extra kolumner."""
+
+    return [dict(columns, **phase) for phase in timings["phases"]]
+
+def save_timings(filename, timings, rows=None):
+    """Spara timings som JSON, eller som CSV med en rad per fas.
+
+    Formatet väljs från filändelsen. rows ersätter timing_rows(timings)
+    i CSV-filen, till exempel för en parameterstudie med flera punkter.
+    """
+
+    if filename.endswith(".csv"):
+        if rows is None:
+            rows = timing_rows(timings)
+
+        fieldnames = []
+        for row in rows:
+            fieldnames += [name for name in row if name not in fieldnames]
+
+        with open(filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(filename, "w") as f:
+            json.dump(timings, f, indent=4)
+
 
 class InputData:
     """Klass för att definiera indata för vår modell."""
@@ -78,6 +508,8 @@ class InputData:
     def geometry(self):
         """Skapa en geometri instans baserat på definierade parametrar"""
 
+        import calfem.geometry as cfg
+
         g = cfg.Geometry()
 
         w = self.__w
@@ -123,6 +555,7 @@ class InputData:
         input_data = {}
         input_data["version"] = self.__version
         input_data["w"] = self.__w
+        input_data["h"] = self.__h
         input_data["t"] = self.__t
         input_data["a"] = self.__a
         input_data["b"] = self.__b
@@ -147,6 +580,7 @@ class InputData:
 
         self.version = input_data["version"] = self.__version
         self.__w = input_data["w"]
+        self.__h = input_data.get("h", self.__h)
         self.__t = input_data["t"]
         self.__a = input_data["a"]
         self.__b = input_data["b"]
@@ -309,10 +743,112 @@ class InputData:
     def ep(self):
         return self.__ep
 
+class NpzArrays:
+    """Läser enskilda arrayer ur en .npz-fil vid behov.
+
+    Med mmap_mode minnesmappas okomprimerade poster direkt i filen,
+    komprimerade poster läses in som vanligt.
+    """
+
+    def __init__(self, filename, mmap_mode=None):
+        self.filename = filename
+        self.mmap_mode = mmap_mode
+
+        with zipfile.ZipFile(filename) as zf:
+            self.names = [
+                name[:-4] for name in zf.namelist() if name.endswith(".npy")
+            ]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def load(self, name):
+        if self.mmap_mode is not None:
+            array = self.memmap(name)
+            if array is not None:
+                return array
+
+        with np.load(self.filename) as npz:
+            return npz[name]
+
+    def memmap(self, name):
+        """Minnesmappa en okomprimerad post, returnerar None om det inte går."""
+
+        with zipfile.ZipFile(self.filename) as zf:
+            info = zf.getinfo(name + ".npy")
+
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+
+        with open(self.filename, "rb") as f:
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_len, extra_len = struct.unpack("<HH", local_header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+
+        shape, fortran_order, dtype = header
+
+        if dtype.hasobject:
+            return None
+
+        return np.memmap(
+            self.filename, dtype=dtype, mode=self.mmap_mode, offset=offset,
+            shape=shape, order="F" if fortran_order else "C"
+        )
+
+
+class LazyArray:
+    """Attribut i OutputData som läses från resultatfilen först vid åtkomst."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        if self.name not in obj.__dict__:
+            source = obj.__dict__.get("source")
+            value = None
+            if source is not None and self.name in source:
+                value = source.load(self.name)
+            obj.__dict__[self.name] = value
+
+        return obj.__dict__[self.name]
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
+
 class OutputData:
     """Klass för att lagra resultaten från körningen."""
 
+    a = LazyArray()
+    r = LazyArray()
+    ed = LazyArray()
+    qs = LazyArray()
+    qt = LazyArray()
+    max_flow = LazyArray()
+    flow = LazyArray()
+    coords = LazyArray()
+    edof = LazyArray()
+    dofs_per_node = LazyArray()
+    el_type = LazyArray()
+
+    array_names = (
+        "a", "r", "ed", "qs", "qt", "max_flow", "flow", "coords", "edof",
+        "dofs_per_node", "el_type"
+    )
+
     def __init__(self):
+        self.source = None
         self.geometry = None
         self.a = None
         self.r = None
@@ -325,6 +861,9 @@ class OutputData:
         self.edof = None
         self.dofs_per_node = None
         self.el_type = None
+        self.bdofs = None
+        self.solver_info = None
+        self.timings = None
 
     def to_dict(self):
         return {
@@ -338,7 +877,8 @@ class OutputData:
             "coords": self.coords,
             "edof": self.edof,
             "dofs_per_node": self.dofs_per_node,
-            "el_type": self.el_type
+            "el_type": self.el_type,
+            "bdofs": self.bdofs
         }
 
     def from_dict(self, json_dict):
@@ -354,11 +894,79 @@ class OutputData:
         self.dofs_per_node = np.asarray(json_dict["dofs_per_node"])
         self.el_type = np.asarray(json_dict["el_type"])
 
-    def export_vtk(self, filename):
-        """Export results to VTK"""
+        # --- Randfrihetsgrader per markör, saknas i äldre resultat
+
+        if json_dict.get("bdofs") is not None:
+            self.bdofs = {
+                int(marker): np.asarray(dofs)
+                for marker, dofs in json_dict["bdofs"].items()
+            }
+        else:
+            self.bdofs = {
+                int(name[6:]): np.asarray(value)
+                for name, value in json_dict.items()
+                if name.startswith("bdofs_")
+            } or None
+
+    def to_arrays(self):
+        """Resultaten som en dict med NumPy-arrayer, för binär lagring.
+
+        bdofs lagras som en array per markör, bdofs_<markör>.
+        """
+
+        arrays = {
+            name: np.asarray(value)
+            for name, value in self.to_dict().items()
+            if value is not None and name != "bdofs"
+        }
+
+        for marker, dofs in (self.bdofs or {}).items():
+            arrays["bdofs_%d" % marker] = np.asarray(dofs)
+
+        return arrays
+
+    def from_npz(self, filename, mmap_mode=None):
+        """Koppla resultaten till en .npz-fil, arrayerna läses vid åtkomst."""
+
+        self.source = NpzArrays(filename, mmap_mode)
+
+        for name in self.array_names:
+            self.__dict__.pop(name, None)
+
+        self.bdofs = {
+            int(name[6:]): self.source.load(name)
+            for name in self.source.names if name.startswith("bdofs_")
+        } or None
+
+    def vtk_fields(self):
+        """Nod- och elementdata för de binära VTK-formaten."""
+
+        point_data = {"pressure": np.asarray(self.a).ravel()}
+        cell_data = {
+            "max_flow": np.asarray(self.max_flow, float),
+            "flow": np.asarray(self.flow, float)
+        }
+
+        return point_data, cell_data
+
+    def export_vtk(self, filename, fmt="ascii"):
+        """Export results to VTK
+
+        fmt är "ascii" (pyvtk), "binary" (legacy VTK) eller "vtu" (XML).
+        De binära formaten skrivs direkt från NumPy-arrayerna.
+        """
 
         print("Exporting results to %s." % filename)
 
+        if fmt in ("binary", "vtu"):
+            write = vw.write_vtu if fmt == "vtu" else vw.write_legacy_binary
+            write(filename, self.coords, self.edof-1, *self.vtk_fields())
+            return
+        elif fmt != "ascii":
+            raise ValueError("Unknown VTK format: %s" % fmt)
+
+        import pyvtk as vtk
+
         points = self.coords.tolist()
         polygons = (self.edof-1).tolist()
 
@@ -403,17 +1011,89 @@ class TempModel:
 
         return json.dumps(self.model, cls=NumpyArrayEncoder, sort_keys=True, indent=4)
 
-    def save(self, filename):
+    def save(self, filename, compressed=True):
+        """Spara modellen, binärt om filnamnet slutar på .npz annars som JSON."""
+
+        if filename.lower().endswith(".npz"):
+            self.save_npz(filename, compressed)
+            return
+
         with open(filename, "w") as f:
             f.write(self.to_json())
 
-    def load(self, filename):
+    def save_npz(self, filename, compressed=True):
+        """Spara resultaten som arrayer med ett JSON-huvud.
+
+        Okomprimerade filer (compressed=False) kan minnesmappas vid läsning.
+        """
+
+        header = {
+            "format_version": 1,
+            "input_data": self.input_data.to_dict()
+        }
+
+        # --- Arrayerna kan vara lästa ur, eller minnesmappade mot, samma
+        #     fil som skrivs. Läs in allt i minnet först och skriv sedan
+        #     till en temporär fil som ersätter målfilen.
+
+        arrays = self.output_data.to_arrays()
+
+        if self.output_data.source is not None:
+            arrays = {name: np.array(value) for name, value in arrays.items()}
+
+        savez = np.savez_compressed if compressed else np.savez
+
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(filename)), prefix=".tmp_",
+            suffix=".npz"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                savez(
+                    f, header=np.array(json.dumps(header, sort_keys=True)),
+                    **arrays
+                )
+
+            # --- mkstemp skapar filen med 0600, ge den samma rättigheter
+            #     som open() hade gett
+
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_filename, 0o666 & ~umask)
+
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+
+    def load(self, filename, mmap_mode=None):
+        """Läs modellen, formatet (JSON eller .npz) avgörs från filinnehållet.
+
+        Från .npz-filer läses arrayerna först när de används, och med
+        mmap_mode="r" minnesmappas okomprimerade arrayer.
+        """
+
+        with open(filename, "rb") as f:
+            magic = f.read(4)
+
+        if magic == b"PK\x03\x04":
+            self.load_npz(filename, mmap_mode)
+            return
+
         json_dict = {}
         with open(filename, "r") as f:
             json_dict = json.load(f)
         
         self.from_dict(json_dict)
 
+    def load_npz(self, filename, mmap_mode=None):
+        with np.load(filename) as npz:
+            header = json.loads(str(npz["header"]))
+
+        self.input_data.from_dict(header["input_data"])
+        self.output_data.from_npz(filename, mmap_mode)
+
     @property
     def input_data(self):
         return self.__input_data
@@ -432,492 +1112,746 @@ class TempModel:
 
 
 
+# Solver som återanvänds av execute_param_point inom en process, så att
+# punkter som bara skiljer sig i lx, ly, bcs eller loads delar nät och
+# konduktivitetsmatriser (se Solver.assemble).
+
+_point_solver = None
+
+def execute_param_point(input_data_dict, filename, mesh_cache=None,
+                        vtk_format="ascii", linear_solver="direct",
+                        result_cache=None):
+    """Beräkna och exportera en parameterpunkt, körs i en separat process."""
+
+    global _point_solver
+
+    input_data = InputData()
+    input_data.from_dict(input_data_dict)
+    output_data = OutputData()
+
+    print("Executing for a = %g, b = %g..." % (input_data.a, input_data.b))
+
+    if _point_solver is None:
+        _point_solver = Solver(input_data, output_data, mesh_cache)
+
+    solver = _point_solver
+    solver.input_data = input_data
+    solver.output_data = output_data
+    solver.mesh_cache = mesh_cache
+    solver.vtk_format = vtk_format
+    solver.linear_solver = linear_solver
+    solver.result_cache = result_cache
+    solver.execute()
+
+    if filename is not None:
+        solver.export_vtk(filename)
+
+    return output_data
+
+
+def execute_sweep_point(input_data_dict, filename, mesh_cache=None,
+                        vtk_format="ascii", linear_solver="direct",
+                        result_cache=None):
+    """Som execute_param_point men utan att skicka tillbaka resultaten."""
+
+    execute_param_point(
+        input_data_dict, filename, mesh_cache, vtk_format, linear_solver,
+        result_cache
+    )
+
+
 class Solver:
     """Klass för att hantera lösningen av vår beräkningsmodell."""
 
-    def __init__(self, input_data, output_data):
+    def __init__(self, input_data, output_data, mesh_cache=None):
         self.input_data = input_data
         self.output_data = output_data
+        self.mesh_cache = mesh_cache
+        self.vtk_format = "ascii"
+        self.assembled_key = None
 
-    def execute(self):
-        """Metod för att utföra finita element beräkningen."""
+        # --- Tidsmätning per fas, "json" eller "csv" i timings_format
+        # sparar tiderna för parameterstudier till fil
 
-        # --- Överför modell variabler till lokala referenser
+        self.timer = PhaseTimer()
+        self.timings_format = None
+        self.param_timings = []
 
-        ep = self.input_data.ep
-        lx = self.input_data.lx
-        ly = self.input_data.ly
-        loads = self.input_data.loads
-        bcs = self.input_data.bcs
-        el_size_factor = self.input_data.el_size_factor
+        # --- Ekvationslösare, "direct" (LU) eller "cg"
 
-        # --- Nätgenerering
+        self.linear_solver = "direct"
+        self.preconditioner = "auto"
+        self.cg_tol = 1e-10
+        self.previous_solution = None
 
-        el_type = 3
-        dofs_per_node = 1
-        geometry = self.input_data.geometry()
+        # --- Cache för lösta modeller, se model_cache.ResultCache
+
+        self.result_cache = None
+
+    def create_mesh(self, geometry, el_type, dofs_per_node):
+        """Skapa nät med gmsh, eller hämta det från mesh_cache om möjligt."""
+
+        key = None
+
+        if self.mesh_cache is not None:
+            key = self.mesh_cache.key(self.input_data, el_type, dofs_per_node)
+            mesh_data = self.mesh_cache.load(key)
+            if mesh_data is not None:
+                return mesh_data
+
+        import calfem.mesh as cfm
 
         mesh = cfm.GmshMeshGenerator(geometry)
 
         # Factor that changes element sizes.
 
-        mesh.el_size_factor = el_size_factor
+        mesh.el_size_factor = self.input_data.el_size_factor
         mesh.el_type = el_type
         mesh.dofs_per_node = dofs_per_node
 
         coords, edof, dofs, bdofs, _ = mesh.create()
 
-        # --- Beräkna element koordinater
+        # --- Cachen är bara en optimering, ett misslyckat skrivförsök
+        #     (t.ex. full disk eller kvot) får inte stoppa beräkningen
 
-        ex, ey = cfc.coordxtr(edof, coords, dofs)
+        if self.mesh_cache is not None:
+            try:
+                self.mesh_cache.store(key, coords, edof, dofs, bdofs)
+            except OSError as e:
+                print("Warning: could not write to mesh cache %s: %s"
+                      % (self.mesh_cache.cache_dir, e))
 
-        self.input_data.ex = ex
-        self.input_data.ey = ey
+        return coords, edof, dofs, bdofs
 
-        # --- Beräkna D-matris
+    def mesh_key(self):
+        """Parametrar som bestämmer nätet och konduktivitetsmatriserna."""
 
-        D = np.array([[lx, 0.0],
-                      [0.0, ly]], float)
+        input_data = self.input_data
 
-        # --- Assemblera systemmatris
+        return (
+            input_data.w, input_data.h, input_data.a, input_data.b,
+            input_data.x, input_data.y, input_data.el_size_factor,
+            tuple(input_data.ep)
+        )
 
-        n_dofs = edof.max()
+    def assemble(self):
+        """Skapa nät, elementkoordinater och systemmatris för indata.
 
-        K = np.zeros([n_dofs, n_dofs])
+        K är linjär i D = [[lx, 0], [0, ly]] och byggs som lx*Kx + ly*Ky.
+        Nätet och komponentmatriserna Kx och Ky sparas i solvern och byggs
+        bara om när mesh_key ändras, så att en ändring av lx, ly, bcs
+        eller loads inte kräver ny nätgenerering eller assemblering.
+        """
 
-        for etopo, eex, eey in zip(edof, ex, ey):
-            Ke = cfc.flw2i4e(eex, eey, ep, D)
-            cfc.assem(etopo, K, Ke)
+        # --- Överför modell variabler till lokala referenser
 
-        # --- Lösning av ekvationssystem
+        ep = self.input_data.ep
+        lx = self.input_data.lx
+        ly = self.input_data.ly
 
-        f = np.zeros([n_dofs, 1])
-        bc_prescr = np.array([], int)
-        bc_val = np.array([], float)
+        mesh_key = self.mesh_key()
 
-        for bc in bcs:
-            bc_prescr, bc_val = cfu.applybc(
-                bdofs, bc_prescr, bc_val, bc[0], bc[1]
-            )
+        if mesh_key != self.assembled_key:
 
-        for load in loads:
-            cfu.applyforcetotal(bdofs, f, load[0], load[1])
+            # --- Nätgenerering
 
-        a, r = cfc.solveq(K, f, bc_prescr, bc_val)
+            el_type = 3
+            dofs_per_node = 1
 
-        # --- Beräkna elementkrafter
+            with self.timer.phase("mesh"):
+                geometry = self.input_data.geometry()
 
-        ed = cfc.extractEldisp(edof, a)
+                coords, edof, dofs, bdofs = self.create_mesh(
+                    geometry, el_type, dofs_per_node
+                )
 
-        max_flow = []
-        flow = []
-        for eex, eey, eed in zip(ex, ey, ed):
-            qs, qt, _ = cfc.flw2i4s(eex, eey, ep, D, eed)
-            max_flow.append(
-                math.sqrt(math.pow(qs[0, 0], 2) + math.pow(qs[0, 1], 2))
-            )
-            flow.append([qs[0, 0], qs[0, 1], 0.0])
-
-        self.output_data.geometry = geometry
-        self.output_data.a = a
-        self.output_data.r = r
-        self.output_data.ed = ed
-        self.output_data.qs = qs
-        self.output_data.qt = qt
-        self.output_data.max_flow = max_flow
-        self.output_data.flow = flow
-        self.output_data.coords = coords
-        self.output_data.edof = edof
-        self.output_data.dofs_per_node = dofs_per_node
-        self.output_data.el_type = el_type
-
-    def execute_param_study(self):
-        """Kör parameter studie"""
+            # --- Beräkna element koordinater
 
-        old_a = self.input_data.a
-        old_b = self.input_data.b
+            with self.timer.phase("coordxtr"):
+                ex, ey = coordxtr_batch(edof, coords, dofs)
 
-        i = 1
+            # --- Assemblera konduktivitetsmatriser för lx = 1 och ly = 1
 
-        if self.input_data.param_a:
-            a_range = np.linspace(
-                self.input_data.a,
-                self.input_data.a_end,
-                self.input_data.param_steps
-            )
-            for a in a_range:
-                print("Executing for a = %g..." % a)
-                self.input_data.a = a
-                self.execute()
-                self.export_vtk(
-                    "%s_%02d.vtk" % (self.input_data.param_filename, i)
-                )
-                i += 1
-        elif self.input_data.param_b:
-            b_range = np.linspace(
-                self.input_data.b,
-                self.input_data.b_end,
-                self.input_data.param_steps
-            )
+            n_dofs = edof.max()
 
-            for b in b_range:
-                print("Executing for b = %g..." % b)
-                self.input_data.b = b
-                self.execute()
-                self.export_vtk(
-                    "%s_%02d.vtk" % (self.input_data.param_filename, i)
+            with self.timer.phase("assemble"):
+                Kx = assem_sparse(
+                    edof, flw2i4e_batch(ex, ey, ep, np.diag([1.0, 0.0])),
+                    n_dofs
+                )
+                Ky = assem_sparse(
+                    edof, flw2i4e_batch(ex, ey, ep, np.diag([0.0, 1.0])),
+                    n_dofs
                 )
-                i += 1
 
-        self.input_data.a = old_a
-        self.input_data.b = old_b
+            self.geometry = geometry
+            self.el_type = el_type
+            self.dofs_per_node = dofs_per_node
+            self.coords = coords
+            self.edof = edof
+            self.dofs = dofs
+            self.bdofs = bdofs
+            self.ex = ex
+            self.ey = ey
+            self.Kx = Kx
+            self.Ky = Ky
+            self.assembled_key = mesh_key
 
-    def export_vtk(self, filename):
-        """Export results to VTK"""
+        self.input_data.ex = self.ex
+        self.input_data.ey = self.ey
 
-        print("Exporting results to %s." % filename)
+        # --- Beräkna D-matris och systemmatris
 
-        points = self.output_data.coords.tolist()
-        polygons = (self.output_data.edof-1).tolist()
+        self.D = np.array([[lx, 0.0],
+                           [0.0, ly]], float)
 
-        point_data = vtk.PointData(
-            vtk.Scalars(self.output_data.a.tolist(), name="pressure")
-        )
-        cell_data = vtk.CellData(
-            vtk.Scalars(self.output_data.max_flow, name="max_flow"),
-            vtk.Vectors(self.output_data.flow, "flow")
-        )
-        structure = vtk.PolyData(points=points, polygons=polygons)
+        with self.timer.phase("system_matrix"):
+            self.K = lx*self.Kx + ly*self.Ky
 
-        vtk_data = vtk.VtkData(structure, point_data, cell_data)
-        vtk_data.tofile(filename, "ascii")
+    def execute_conductivity_study(self, conductivities):
+        """Lös för en lista med (lx, ly) på samma nät.
 
+        Nätet och Kx, Ky byggs en gång och varje punkt kräver bara att K
+        kombineras och löses. Returnerar en OutputData per punkt.
+        """
 
-class Report:
-    """Klass för presentation av indata och utdata i rapportform."""
+        old_lx = self.input_data.lx
+        old_ly = self.input_data.ly
 
-    def __init__(self, input_data, output_data):
-        self.input_data = input_data
-        self.output_data = output_data
-        self.report = ""
+        results = []
 
-    def clear(self):
-        self.report = ""
+        try:
+            for lx, ly in conductivities:
+                print("Executing for lx = %g, ly = %g..." % (lx, ly))
+                self.input_data.lx = lx
+                self.input_data.ly = ly
 
-    def add_text(self, text=""):
-        self.report += str(text)+"\n"
+                output_data = OutputData()
+                self.execute(output_data)
+                results.append(output_data)
+        finally:
+            self.input_data.lx = old_lx
+            self.input_data.ly = old_ly
 
-    def __str__(self):
+        return results
 
-        np.set_printoptions(
-            formatter={'float': '{: 10.3f}'.format}, threshold=sys.maxsize
-        )
+    def store_results(self, output_data, a, r):
+        """Beräkna elementflöden för lösningen a och spara i output_data."""
 
-        self.clear()
-        self.add_text()
-        self.add_text("-------------------------------------------------------------")
-        self.add_text("-------------- Model input ----------------------------------")
-        self.add_text("-------------------------------------------------------------")
-        self.add_text()
-        self.add_text("Model parameters:")
-        self.add_text()
-
-        parameters = [
-            ["w", self.input_data.w],
-            ["h", self.input_data.h],
-            ["a", self.input_data.a],
-            ["b", self.input_data.b],
-            ["x", self.input_data.x],
-            ["y", self.input_data.y],
-        ]
+        edof = self.edof
 
-        self.add_text(
-            tbl.tabulate(
-                parameters,
-                headers=["Parameter", "Value"],
-                numalign="right",
-                floatfmt=".4f",
-                tablefmt="psql",
-                )
-            )
+        # --- Beräkna elementkrafter
 
-        # --- Randvillkor
+        ed = a[edof-1, 0]
+
+        qs, qt, _ = flw2i4s_batch(self.ex, self.ey, self.input_data.ep,
+                                  self.D, ed)
+
+        max_flow = np.hypot(qs[:, 0, 0], qs[:, 0, 1])
+
+        flow = np.zeros([edof.shape[0], 3])
+        flow[:, 0:2] = qs[:, 0, :]
+
+        output_data.geometry = self.geometry
+        output_data.a = a
+        output_data.r = r
+        output_data.ed = ed
+        output_data.qs = qs
+        output_data.qt = qt
+        output_data.max_flow = max_flow
+        output_data.flow = flow
+        output_data.coords = self.coords
+        output_data.edof = edof
+        output_data.dofs_per_node = self.dofs_per_node
+        output_data.el_type = self.el_type
+        output_data.bdofs = {
+            marker: np.asarray(dofs) for marker, dofs in self.bdofs.items()
+        }
 
-        self.add_text()
-        self.add_text("Model boundary conditions:")
-        self.add_text()
-        self.add_text(
-            tbl.tabulate(
-                self.input_data.bcs,
-                headers=["Marker", "Pressure"],
-                numalign="right",
-                floatfmt=".4f",
-                tablefmt="psql",
-                )
-            )
-        self.add_text()
-        self.add_text("Conductivty:")
-        self.add_text()
+    def execute(self, output_data=None):
+        """Metod för att utföra finita element beräkningen.
 
-        cond = [
-            ["lx", self.input_data.lx],
-            ["ly", self.input_data.ly]
-        ]
+        Resultaten sparas i output_data, som standard solverns output_data.
+        """
 
-        self.add_text(
-            tbl.tabulate(
-                cond,
-                headers=["Parameter", "Value"],
-                numalign="right",
-                floatfmt=".4f",
-                tablefmt="psql",
-                )
-            )
-        self.add_text()
-        self.add_text("-------------------------------------------------------------")
-        self.add_text("-------------- Results --------------------------------------")
-        self.add_text("-------------------------------------------------------------")
-        self.add_text()
-        self.add_text("Element coordinates:")
-        self.add_text()
-
-        self.add_text(
-            tbl.tabulate(
-                self.output_data.coords,
-                headers=["Node", "x", "y"],
-                numalign="right",
-                floatfmt=".4f",
-                tablefmt="psql",
-                showindex=range(1, len(self.output_data.coords) + 1)
+        if output_data is None:
+            output_data = self.output_data
+
+        self.timer = PhaseTimer()
+
+        result_key = None
+
+        if self.result_cache is not None:
+            with self.timer.phase("result_cache"):
+                result_key = self.result_cache.key(
+                    self.input_data.to_dict(), SOLVER_VERSION,
+                    self.linear_solver
                 )
+                arrays = self.result_cache.get(result_key)
+
+            if arrays is not None:
+                print("Using cached results.")
+                output_data.from_dict(arrays)
+                output_data.geometry = self.input_data.geometry()
+                output_data.solver_info = {"method": "cached"}
+                output_data.timings = self.timer.to_dict()
+                return
+
+        self.assemble()
+
+        # --- Lösning av ekvationssystem
+
+        with self.timer.phase("applybc"):
+            f, bc_prescr, bc_val = apply_bcs(
+                self.bdofs, self.input_data.bcs, self.input_data.loads,
+                self.K.shape[0]
             )
-        self.add_text()
-        self.add_text("Element topology:")
-        self.add_text()
-        self.add_text(
-            tbl.tabulate(
-                self.output_data.edof,
-                headers=["Element", "i1", "i2", "i3", "i4", "i5"],
-                numalign="right",
-                tablefmt="psql",
-                showindex=range(1, len(self.output_data.edof) + 1)
+
+        with self.timer.phase("solve"):
+            if self.linear_solver == "cg":
+                a, r, solver_info = solveq_cg(
+                    self.K, f, bc_prescr, bc_val, self.initial_guess(),
+                    self.cg_tol, self.preconditioner
                 )
-            )
-        self.add_text()
-        self.add_text("Element displacements:")
-        self.add_text()
-        self.add_text(
-            tbl.tabulate(
-                self.output_data.ed,
-                headers=["Element", "ed1", "ed2", "ed3", "ed4", "ed5"],
-                numalign="right",
-                tablefmt="psql",
-                floatfmt=".4f",
-                showindex=range(1, len(self.output_data.ed) + 1)
+                print("CG (%s) converged in %d iterations, residual %g."
+                      % (solver_info["preconditioner"],
+                         solver_info["iterations"], solver_info["residual"]))
+            elif self.linear_solver == "direct":
+                a, r = solveq_sparse(self.K, f, bc_prescr, bc_val)
+                solver_info = {"method": "direct"}
+            else:
+                raise ValueError(
+                    "Unknown linear solver: %s" % self.linear_solver
                 )
-            )
-        self.add_text()
-        self.add_text("Displacements:")
-        self.add_text()
-        self.add_text(
-            tbl.tabulate(
-                self.output_data.a,
-                headers=["Node", "Pressure"],
-                numalign="right",
-                floatfmt=".4f",
-                tablefmt="psql",
-                showindex=range(1, len(self.output_data.a) + 1)
+
+        self.previous_solution = (self.coords, a[self.dofs[:, 0]-1, 0])
+
+        with self.timer.phase("flux"):
+            self.store_results(output_data, a, r)
+
+        output_data.solver_info = solver_info
+
+        if result_key is not None:
+            with self.timer.phase("result_cache"):
+                try:
+                    self.result_cache.put(result_key, output_data.to_arrays())
+                except OSError as e:
+                    print("Warning: could not write to result cache %s: %s"
+                          % (self.result_cache.cache_dir, e))
+
+        output_data.timings = self.timer.to_dict()
+
+    def initial_guess(self):
+        """Startgissning för CG från föregående lösning, eller None.
+
+        Om nätet har ändrats interpoleras föregående nodvärden linjärt
+        till de nya noderna, noder utanför det gamla nätet får värdet i
+        närmaste gamla nod.
+        """
+
+        if self.previous_solution is None:
+            return None
+
+        coords, values = self.previous_solution
+
+        if coords.shape != self.coords.shape or \
+                not np.array_equal(coords, self.coords):
+            from scipy.interpolate import griddata
+
+            new_values = griddata(coords, values, self.coords, method="linear")
+            outside = np.isnan(new_values)
+            if outside.any():
+                new_values[outside] = griddata(
+                    coords, values, self.coords[outside], method="nearest"
                 )
-            )
-        self.add_text()
-        self.add_text("Reactions:")
-        self.add_text()
-        self.add_text(
-            tbl.tabulate(
-                self.output_data.r,
-                headers=["Node", "Flow"],
-                numalign="right",
-                floatfmt=".4f",
-                tablefmt="psql",
-                showindex=range(1, len(self.output_data.r) + 1)
+            values = new_values
+
+        x0 = np.zeros(self.K.shape[0])
+        x0[self.dofs[:, 0]-1] = values
+
+        return x0
+
+    def execute_load_cases(self, load_cases):
+        """Lös flera last- och randvillkorsfall på samma nät.
+
+        load_cases är en lista med dicts med nycklarna "bcs" och "loads" i
+        samma form som InputData.bcs och InputData.loads, saknade nycklar
+        tas från input_data. Systemmatrisen faktoriseras en gång per
+        uppsättning föreskrivna frihetsgrader och alla fall i gruppen löses
+        som ett block av högerled. Returnerar en OutputData per fall.
+        """
+
+        self.timer = PhaseTimer()
+
+        self.assemble()
+
+        n_dofs = self.K.shape[0]
+        n_cases = len(load_cases)
+
+        f = np.zeros([n_dofs, n_cases])
+        groups = {}
+
+        with self.timer.phase("applybc"):
+            for i, load_case in enumerate(load_cases):
+                f_case, bc_prescr, bc_val = apply_bcs(
+                    self.bdofs,
+                    load_case.get("bcs", self.input_data.bcs),
+                    load_case.get("loads", self.input_data.loads),
+                    n_dofs
                 )
-            )
-        self.add_text()
-        self.add_text("Element flows:")
-        self.add_text()
-
-        flow_arr = np.asarray(self.output_data.flow)
-
-        self.add_text(
-            tbl.tabulate(
-                flow_arr[:, 0:2],
-                headers=["Element", "qx", "qy"],
-                numalign="right",
-                tablefmt="psql",
-                floatfmt=".4f",
-                showindex=range(1, len(flow_arr) + 1)
+                f[:, i] = f_case[:, 0]
+                groups.setdefault(tuple(bc_prescr), []).append((i, bc_val))
+
+        a = np.zeros([n_dofs, n_cases])
+        r = np.zeros([n_dofs, n_cases])
+
+        with self.timer.phase("solve"):
+            for bc_prescr, cases in groups.items():
+                print("Solving %d load cases with %d prescribed dofs..."
+                      % (len(cases), len(bc_prescr)))
+
+                columns = [i for i, _ in cases]
+                bc_val = np.column_stack([bc_val for _, bc_val in cases])
+
+                system = FactorizedSystem(self.K, np.array(bc_prescr, int))
+                a[:, columns], r[:, columns] = system.solve(
+                    f[:, columns], bc_val
                 )
-            )
-        self.add_text()
-        return self.report
 
+        results = []
 
-class Visualisation:
-    """Klass för visualisering av resulat"""
+        with self.timer.phase("flux"):
+            for i in range(n_cases):
+                output_data = OutputData()
+                self.store_results(output_data, a[:, i:i+1], r[:, i:i+1])
+                output_data.solver_info = {"method": "direct"}
+                results.append(output_data)
 
-    def __init__(self, input_data, output_data):
-        """Konstruktor"""
+        timings = self.timer.to_dict()
 
-        self.input_data = input_data
-        self.output_data = output_data
+        for output_data in results:
+            output_data.timings = timings
+
+        return results
+
+    def execute_param_study(self, n_workers=1, series=False):
+        """Kör parameter studie
 
-        self.geom_fig = None
-        self.mesh_fig = None
-        self.el_value_fig = None
-        self.node_value_fig = None
+        Med n_workers > 1 körs parameterpunkterna parallellt i en
+        processpool. Med series=True skrivs alla steg till en XDMF-fil
+        (param_filename.xdmf) med parametern som tidsaxel i stället för
+        en VTK-fil per steg. Returnerar listan med skrivna filer i ordning.
 
-        self.geom_widget = None
-        self.mesh_widget = None
-        self.el_value_widget = None
-        self.node_value_widget = None
+        Tiderna för varje punkt sparas i param_timings och, om
+        timings_format är "json" eller "csv", i param_filename_timings.
+        """
 
-    def show(self):
-        """Visa alla visualiseringsfönster"""
-        geometry = self.output_data.geometry
-        a = self.output_data.a
-        max_flow = self.output_data.max_flow
-        coords = self.output_data.coords
-        edof = self.output_data.edof
-        dofs_per_node = self.output_data.dofs_per_node
-        el_type = self.output_data.el_type
+        old_a = self.input_data.a
+        old_b = self.input_data.b
+
+        if self.input_data.param_a:
+            param = "a"
+            param_range = np.linspace(
+                self.input_data.a,
+                self.input_data.a_end,
+                self.input_data.param_steps
+            )
+        elif self.input_data.param_b:
+            param = "b"
+            param_range = np.linspace(
+                self.input_data.b,
+                self.input_data.b_end,
+                self.input_data.param_steps
+            )
+        else:
+            return []
+
+        series_writer = None
+        self.param_timings = []
+
+        if series:
+            series_writer = vw.XdmfSeriesWriter(self.input_data.param_filename)
+            filenames = [None]*len(param_range)
+        else:
+            filenames = [
+                "%s_%02d%s" % (
+                    self.input_data.param_filename, i,
+                    vw.vtk_extension(self.vtk_format)
+                )
+                for i in range(1, len(param_range) + 1)
+            ]
 
-        cfv.figure()
-        cfv.draw_geometry(geometry, title="Geometry")
+        try:
+            if n_workers > 1:
+                self.__execute_param_pool(
+                    param, param_range, filenames, n_workers, series_writer
+                )
+            else:
+                for value, filename in zip(param_range, filenames):
+                    print("Executing for %s = %g..." % (param, value))
+                    setattr(self.input_data, param, value)
+                    self.execute()
+                    if series_writer is not None:
+                        with self.timer.phase("export_xdmf"):
+                            self.__add_series_step(
+                                series_writer, value, self.output_data
+                            )
+                        self.output_data.timings = self.timer.to_dict()
+                    else:
+                        self.export_vtk(filename)
+                    self.__add_param_timings(param, value, self.output_data)
+        finally:
+            self.input_data.a = old_a
+            self.input_data.b = old_b
+
+        if self.timings_format is not None:
+            self.save_param_timings("%s_timings.%s" % (
+                self.input_data.param_filename, self.timings_format
+            ))
+
+        if series_writer is not None:
+            return [series_writer.xdmf_filename]
+
+        return filenames
+
+    def __add_param_timings(self, param, value, output_data):
+        self.param_timings.append({
+            "param": param,
+            "value": float(value),
+            "timings": output_data.timings
+        })
+
+    def save_param_timings(self, filename):
+        """Spara tiderna för parameterstudiens punkter som JSON eller CSV."""
+
+        rows = []
+        for point in self.param_timings:
+            rows += timing_rows(
+                point["timings"], param=point["param"], value=point["value"]
+            )
 
-        cfv.figure()
-        cfv.draw_element_values(max_flow, coords, edof, dofs_per_node, el_type,
-                                None, draw_elements=False, title="Max flows")
+        save_timings(filename, self.param_timings, rows)
 
-        cfv.figure()
-        cfv.draw_mesh(coords, edof, dofs_per_node, el_type, filled=True,
-                      title="Mesh")
+    def __add_series_step(self, series_writer, value, output_data):
+        print("Adding %s step %g." % (series_writer.xdmf_filename, value))
 
-        cfv.figure()
-        cfv.draw_nodal_values(a, coords, edof, el_type=el_type,
-                              draw_elements=False, title="Nodal values")
+        series_writer.add_step(
+            value, output_data.coords, output_data.edof-1,
+            *output_data.vtk_fields()
+        )
 
-        cfv.colorbar()
+    def __execute_param_pool(self, param, param_range, filenames, n_workers,
+                             series_writer=None):
+        """Kör parameterpunkterna i en processpool och samla resultaten."""
 
-    def close_all(self):
-        """Stäng alla visualiseringsfönster"""
+        points = []
+        for value in param_range:
+            setattr(self.input_data, param, value)
+            points.append(self.input_data.to_dict())
 
-        cfv.closeAll()
+        result = None
+        errors = []
+        first_error = None
 
-        self.geom_fig = None
-        self.mesh_fig = None
-        self.el_value_fig = None
-        self.node_value_fig = None
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(
+                    execute_param_point, point, filename, self.mesh_cache,
+                    self.vtk_format, self.linear_solver, self.result_cache
+                )
+                for point, filename in zip(points, filenames)
+            ]
 
-        if self.geom_widget is not None:
-            self.geom_widget.close()
-        if self.mesh_widget is not None:
-            self.mesh_widget.close()
-        if self.el_value_widget is not None:
-            self.el_value_widget.close()
-        if self.node_value_widget is not None:
-            self.node_value_widget.close()
+            for value, future in zip(param_range, futures):
+                try:
+                    result = future.result()
+                    if series_writer is not None:
+                        self.__add_series_step(series_writer, value, result)
+                    self.__add_param_timings(param, value, result)
+                except Exception as e:
+                    errors.append("%s = %g: %r" % (param, value, e))
+                    first_error = first_error or e
 
-    def show_geometry(self, no_show=False):
-        """Visa geometri visualisering"""
+        if errors:
+            raise RuntimeError(
+                "Parameter study failed for %d of %d points:\n  %s"
+                % (len(errors), len(points), "\n  ".join(errors))
+            ) from first_error
 
-        geometry = self.output_data.geometry
+        # --- Behåll resultatet från sista punkten, som vid seriell körning
 
-        self.geom_fig = cfv.figure(self.geom_fig)
+        vars(self.output_data).update(vars(result))
 
-        if self.geom_widget is None:
-            self.geom_widget = cfv.figure_widget(self.geom_fig)
+    def export_vtk(self, filename):
+        """Export results to VTK"""
 
-        cfv.clf()
-        cfv.draw_geometry(geometry, title="Geometry")
+        with self.timer.phase("export_vtk"):
+            self.output_data.export_vtk(filename, self.vtk_format)
 
-        if no_show:
-            return self.geom_widget
+        self.output_data.timings = self.timer.to_dict()
 
-        self.geom_widget.show()
+    def save_timings(self, filename):
+        """Spara tiderna för senaste körningen som JSON eller CSV."""
 
-        return None
+        save_timings(filename, self.output_data.timings)
 
-    def show_mesh(self, no_show=False):
-        """Visa nät visualisering"""
 
-        coords = self.output_data.coords
-        edof = self.output_data.edof
-        dofs_per_node = self.output_data.dofs_per_node
-        el_type = self.output_data.el_type
+class ParamSweep:
+    """Parametersvep över InputData-parametrar med återstartbart tillstånd.
 
-        self.mesh_fig = cfv.figure(self.mesh_fig)
+    Punkterna ges som en kartesisk produkt (add_product) eller som en
+    lista (add_points). Avklarade punkter sparas löpande i en manifestfil
+    så att ett avbrutet svep fortsätter där det slutade.
+    """
 
-        if self.mesh_widget is None:
-            self.mesh_widget = cfv.figure_widget(self.mesh_fig)
+    params = ("a", "b", "x", "y", "w", "h", "lx", "ly", "el_size_factor")
 
-        cfv.clf()
-        cfv.draw_mesh(coords, edof, dofs_per_node, el_type, filled=True,
-                      title="Mesh")
+    def __init__(self, input_data, basename="sweep", mesh_cache=None):
+        self.input_data = input_data
+        self.basename = basename
+        self.mesh_cache = mesh_cache
+        self.vtk_format = "ascii"
+        self.linear_solver = "direct"
+        self.result_cache = None
+        self.points = []
 
-        if no_show:
-            return self.mesh_widget
+    def add_point(self, **point):
+        for name in point:
+            if name not in self.params:
+                raise ValueError("Unknown sweep parameter: %s" % name)
 
-        self.mesh_widget.show()
+        self.points.append({name: float(v) for name, v in point.items()})
 
-        return None
+    def add_points(self, points):
+        for point in points:
+            self.add_point(**point)
 
-    def show_nodal_values(self, no_show=False):
-        """Visa nodvärden"""
+    def add_product(self, **ranges):
+        names = list(ranges.keys())
+        for values in itertools.product(*ranges.values()):
+            self.add_point(**dict(zip(names, values)))
 
-        a = self.output_data.a
-        coords = self.output_data.coords
-        edof = self.output_data.edof
-        dofs_per_node = self.output_data.dofs_per_node
-        el_type = self.output_data.el_type
+    @property
+    def manifest_filename(self):
+        return "%s_manifest.json" % self.basename
 
-        self.node_value_fig = cfv.figure(self.node_value_fig)
+    def point_filename(self, index):
+        return "%s_%04d%s" % (
+            self.basename, index, vw.vtk_extension(self.vtk_format)
+        )
 
-        if self.node_value_widget is None:
-            self.node_value_widget = cfv.figure_widget(self.node_value_fig)
+    def load_manifest(self):
+        """Läs manifest, eller skapa ett nytt om det saknas."""
 
-        cfv.clf()
-        cfv.draw_nodal_values(a, coords, edof, dofs_per_node=dofs_per_node,
-                              el_type=el_type, draw_elements=False,
-                              title="Nodal values")
+        manifest = {
+            "input_data": self.input_data.to_dict(),
+            "points": self.points,
+            "completed": {}
+        }
 
-        if no_show:
-            return self.node_value_widget
+        if not os.path.exists(self.manifest_filename):
+            return manifest
 
-        self.node_value_widget.show()
+        with open(self.manifest_filename, "r") as f:
+            saved = json.load(f)
 
-        return None
+        if saved["points"] != manifest["points"] or \
+                saved["input_data"] != manifest["input_data"]:
+            raise ValueError(
+                "%s belongs to a different sweep, remove it or change basename"
+                % self.manifest_filename
+            )
 
-    def show_element_values(self, no_show=False):
-        """Visa elementvärden"""
+        return saved
 
-        max_flow = self.output_data.max_flow
-        coords = self.output_data.coords
-        edof = self.output_data.edof
-        dofs_per_node = self.output_data.dofs_per_node
-        el_type = self.output_data.el_type
+    def save_manifest(self, manifest):
+        tmp_filename = self.manifest_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(manifest, f, sort_keys=True, indent=4)
+        os.replace(tmp_filename, self.manifest_filename)
 
-        self.el_value_fig = cfv.figure(self.el_value_fig)
+    def run(self, n_workers=1, batch_size=None):
+        """Kör alla punkter som inte redan är klara, batchvis.
 
-        if self.el_value_widget is None:
-            self.el_value_widget = cfv.figure_widget(self.el_value_fig)
+        Manifestet uppdateras efter varje avklarad punkt. Returnerar
+        manifestet när alla punkter är klara.
+        """
 
-        cfv.clf()
-        cfv.draw_element_values(max_flow, coords, edof, dofs_per_node, el_type,
-                                None, draw_elements=False, title="Max flows")
+        manifest = self.load_manifest()
+        completed = manifest["completed"]
 
-        if no_show:
-            return self.el_value_widget
+        pending = [
+            i for i in range(len(self.points)) if str(i) not in completed
+        ]
 
-        self.el_value_widget.show()
+        if len(completed) > 0:
+            print("Resuming sweep, %d of %d points already completed."
+                  % (len(completed), len(self.points)))
+
+        if batch_size is None:
+            batch_size = max(n_workers, 1)*4
+
+        base_dict = self.input_data.to_dict()
+        errors = []
+        first_error = None
+
+        pool = None
+        if n_workers > 1:
+            pool = ProcessPoolExecutor(max_workers=n_workers)
+
+        try:
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+
+                for index, error in self.__run_batch(pool, base_dict, batch):
+                    if error is None:
+                        completed[str(index)] = self.point_filename(index)
+                        self.save_manifest(manifest)
+                    else:
+                        errors.append("point %d %s: %r"
+                                      % (index, self.points[index], error))
+                        first_error = first_error or error
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if errors:
+            raise RuntimeError(
+                "Sweep failed for %d of %d points:\n  %s"
+                % (len(errors), len(self.points), "\n  ".join(errors))
+            ) from first_error
+
+        return manifest
+
+    def __run_batch(self, pool, base_dict, batch):
+        """Kör en batch och returnera (index, fel eller None) per punkt."""
+
+        def point_dict(index):
+            input_data_dict = dict(base_dict)
+            input_data_dict.update(self.points[index])
+            return input_data_dict
+
+        if pool is None:
+            for index in batch:
+                try:
+                    execute_sweep_point(
+                        point_dict(index), self.point_filename(index),
+                        self.mesh_cache, self.vtk_format, self.linear_solver,
+                        self.result_cache
+                    )
+                    yield index, None
+                except Exception as e:
+                    yield index, e
+            return
+
+        futures = {
+            pool.submit(
+                execute_sweep_point, point_dict(index),
+                self.point_filename(index), self.mesh_cache, self.vtk_format,
+                self.linear_solver, self.result_cache
+            ): index
+            for index in batch
+        }
 
-        return None
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import numpy as np
+import tabulate as tbl
+
+
+def write_table(f, values, headers, floatfmt=".4f", chunk_size=10000):
+    """Skriv en numerisk tabell i psql-format till f, chunk_size rader åt gången.
+
+    Första kolumnen är radnumret med start på 1. Kolumnbredderna räknas
+    fram från största värdet i varje kolumn, så tabellen kan skrivas
+    utan att alla rader formateras i minnet på en gång.
+    """
+
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+
+    n_rows, n_cols = values.shape
+    headers = list(headers[:n_cols + 1])
+
+    is_float = values.dtype.kind == "f"
+
+    if n_rows > 0:
+        if is_float:
+            col_max = np.abs(values).max(axis=0)
+            col_widths = [len(("-%" + floatfmt) % v) for v in col_max]
+        else:
+            col_widths = [
+                len(str(v)) + 1 for v in np.abs(values).max(axis=0)
+            ]
+    else:
+        col_widths = [1]*n_cols
+
+    widths = [max(len(headers[0]), len(str(n_rows)))] + [
+        max(len(header), width)
+        for header, width in zip(headers[1:], col_widths)
+    ]
+
+    value_fmt = ("%" + floatfmt) if is_float else "%d"
+
+    row_fmt = "| " + " | ".join(["%*s"]*(n_cols + 1)) + " |\n"
+
+    def line(edge, inner):
+        return edge + inner.join("-"*(width + 2) for width in widths) + \
+            edge + "\n"
+
+    f.write(line("+", "+"))
+    f.write(row_fmt % tuple(
+        item for width, header in zip(widths, headers)
+        for item in (width, header)
+    ))
+    f.write(line("|", "+"))
+
+    for start in range(0, n_rows, chunk_size):
+        chunk = values[start:start + chunk_size]
+        lines = []
+        for i, row in enumerate(chunk.tolist()):
+            fields = [widths[0], start + i + 1]
+            for width, value in zip(widths[1:], row):
+                fields += [width, value_fmt % value]
+            lines.append(row_fmt % tuple(fields))
+        f.write("".join(lines))
+
+    f.write(line("+", "+"))
+
+
+class Report:
+    """Klass för presentation av indata och utdata i rapportform.
+
+    Rapporten skrivs avsnitt för avsnitt till en fil med write. Med
+    summary=True ersätts de fullständiga tabellerna med statistik och
+    de top_n största värdena, vilket ger begränsad storlek även för
+    mycket fina nät.
+
+    Text som läggs till med add_text samlas i report och skrivs sist i
+    rapporten.
+    """
+
+    def __init__(self, input_data, output_data):
+        self.input_data = input_data
+        self.output_data = output_data
+        self.report = ""
+
+    def clear(self):
+        self.report = ""
+
+    def add_text(self, text=""):
+        self.report += str(text)+"\n"
+
+    def write(self, f, summary=False, top_n=10):
+        """Skriv rapporten till den filliknande objektet f."""
+
+        self.write_input(f)
+
+        f.write("\n")
+        f.write("-------------------------------------------------------------\n")
+        f.write("-------------- Results --------------------------------------\n")
+        f.write("-------------------------------------------------------------\n")
+
+        if summary:
+            self.write_summary(f, top_n)
+        else:
+            self.write_results(f)
+
+        f.write("\n")
+
+        if self.report:
+            f.write(self.report)
+
+    def save(self, filename, summary=False, top_n=10):
+        """Skriv rapporten till filen filename."""
+
+        with open(filename, "w") as f:
+            self.write(f, summary, top_n)
+
+    def write_section(self, f, title, text):
+        f.write("\n%s\n\n" % title)
+        f.write(text)
+        f.write("\n")
+
+    def write_small_table(self, f, title, rows, headers):
+        self.write_section(f, title, tbl.tabulate(
+            rows,
+            headers=headers,
+            numalign="right",
+            floatfmt=".4f",
+            tablefmt="psql",
+        ))
+
+    def write_input(self, f):
+        f.write("\n")
+        f.write("-------------------------------------------------------------\n")
+        f.write("-------------- Model input ----------------------------------\n")
+        f.write("-------------------------------------------------------------\n")
+
+        parameters = [
+            ["w", self.input_data.w],
+            ["h", self.input_data.h],
+            ["a", self.input_data.a],
+            ["b", self.input_data.b],
+            ["x", self.input_data.x],
+            ["y", self.input_data.y],
+        ]
+
+        self.write_small_table(
+            f, "Model parameters:", parameters, ["Parameter", "Value"]
+        )
+
+        # --- Randvillkor
+
+        self.write_small_table(
+            f, "Model boundary conditions:", self.input_data.bcs,
+            ["Marker", "Pressure"]
+        )
+
+        cond = [
+            ["lx", self.input_data.lx],
+            ["ly", self.input_data.ly]
+        ]
+
+        self.write_small_table(f, "Conductivty:", cond, ["Parameter", "Value"])
+
+    def write_results(self, f):
+        """Fullständiga tabeller för noder och element."""
+
+        output_data = self.output_data
+
+        tables = [
+            ("Element coordinates:", output_data.coords,
+             ["Node", "x", "y"]),
+            ("Element topology:", output_data.edof,
+             ["Element", "i1", "i2", "i3", "i4", "i5"]),
+            ("Element displacements:", output_data.ed,
+             ["Element", "ed1", "ed2", "ed3", "ed4", "ed5"]),
+            ("Displacements:", output_data.a,
+             ["Node", "Pressure"]),
+            ("Reactions:", output_data.r,
+             ["Node", "Flow"]),
+            ("Element flows:", np.asarray(output_data.flow)[:, 0:2],
+             ["Element", "qx", "qy"])
+        ]
+
+        for title, values, headers in tables:
+            f.write("\n%s\n\n" % title)
+            write_table(f, values, headers)
+
+    def write_summary(self, f, top_n=10):
+        """Statistik och de top_n största värdena i stället för hela tabeller."""
+
+        output_data = self.output_data
+
+        a = np.asarray(output_data.a).ravel()
+        r = np.asarray(output_data.r).ravel()
+        flow = np.asarray(output_data.flow)
+        max_flow = np.asarray(output_data.max_flow).ravel()
+
+        mesh = [
+            ["Nodes", np.asarray(output_data.coords).shape[0]],
+            ["Elements", np.asarray(output_data.edof).shape[0]]
+        ]
+
+        self.write_section(f, "Mesh:", tbl.tabulate(
+            mesh, headers=["", "Count"], tablefmt="psql"
+        ))
+
+        statistics = [
+            [name, values.min(), values.max(), values.mean(), values.std()]
+            for name, values in (
+                ("Pressure", a),
+                ("Reactions", r),
+                ("max_flow", max_flow),
+                ("qx", flow[:, 0]),
+                ("qy", flow[:, 1])
+            )
+        ]
+
+        self.write_small_table(
+            f, "Statistics:", statistics, ["", "Min", "Max", "Mean", "Std"]
+        )
+
+        top_elements = np.argsort(max_flow)[::-1][:top_n]
+
+        self.write_small_table(
+            f, "Elements with largest flow (top %d):" % len(top_elements),
+            [[i + 1, max_flow[i], flow[i, 0], flow[i, 1]]
+             for i in top_elements],
+            ["Element", "max_flow", "qx", "qy"]
+        )
+
+        top_nodes = np.argsort(np.abs(r))[::-1][:top_n]
+
+        self.write_small_table(
+            f, "Nodes with largest reactions (top %d):" % len(top_nodes),
+            [[i + 1, r[i], a[i]] for i in top_nodes],
+            ["Node", "Flow", "Pressure"]
+        )
+
+    def __str__(self):
+        f = io.StringIO()
+        self.write(f)
+        return f.getvalue()
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import calfem.vis_mpl as cfv
+
+
+def rasterize_triangles(verts, triangles, extent, nx, ny, chunk_size=4000000):
+    """Triangelindex och barycentriska vikter i pixelcentra för ett nx x ny rutnät.
+
+    Varje triangel testas bara mot pixelcentra inom sin omskrivna
+    rektangel. Pixlar utanför nätet får index -1. Arbetet delas upp så
+    att högst chunk_size pixel/triangel-par behandlas åt gången.
+    """
+
+    x0, x1, y0, y1 = extent
+
+    dx = (x1 - x0)/nx
+    dy = (y1 - y0)/ny
+
+    tx = verts[triangles, 0]
+    ty = verts[triangles, 1]
+
+    # --- Pixelintervall inom varje triangels omskrivna rektangel
+
+    i0 = np.clip(np.ceil((tx.min(axis=1) - x0)/dx - 0.5), 0, nx).astype(int)
+    i1 = np.clip(np.floor((tx.max(axis=1) - x0)/dx - 0.5), -1, nx - 1).astype(int)
+    j0 = np.clip(np.ceil((ty.min(axis=1) - y0)/dy - 0.5), 0, ny).astype(int)
+    j1 = np.clip(np.floor((ty.max(axis=1) - y0)/dy - 0.5), -1, ny - 1).astype(int)
+
+    count_x = np.maximum(i1 - i0 + 1, 0)
+    count = count_x*np.maximum(j1 - j0 + 1, 0)
+
+    triangle = np.full((ny, nx), -1, dtype=int)
+    weights = np.zeros((ny, nx, 3))
+
+    candidates = np.flatnonzero(count)
+    offsets = np.concatenate(([0], np.cumsum(count[candidates])))
+
+    start = 0
+
+    while start < len(candidates):
+        stop = max(
+            np.searchsorted(offsets, offsets[start] + chunk_size, "right") - 1,
+            start + 1
+        )
+
+        tids = candidates[start:stop]
+        n_pairs = count[tids]
+
+        t = np.repeat(tids, n_pairs)
+        local = np.arange(n_pairs.sum()) - np.repeat(
+            offsets[start:stop] - offsets[start], n_pairs
+        )
+
+        ix = i0[t] + local % count_x[t]
+        iy = j0[t] + local // count_x[t]
+
+        px = x0 + dx*(ix + 0.5)
+        py = y0 + dy*(iy + 0.5)
+
+        ax, ay = tx[t, 0], ty[t, 0]
+        v0x, v0y = tx[t, 1] - ax, ty[t, 1] - ay
+        v1x, v1y = tx[t, 2] - ax, ty[t, 2] - ay
+        v2x, v2y = px - ax, py - ay
+
+        den = v0x*v1y - v1x*v0y
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            l1 = (v2x*v1y - v1x*v2y)/den
+            l2 = (v0x*v2y - v2x*v0y)/den
+
+        l0 = 1.0 - l1 - l2
+
+        eps = -1e-10
+        inside = (den != 0.0) & (l0 >= eps) & (l1 >= eps) & (l2 >= eps)
+
+        triangle[iy[inside], ix[inside]] = t[inside]
+        weights[iy[inside], ix[inside]] = np.c_[l0, l1, l2][inside]
+
+        start = stop
+
+    return triangle, weights
+
+
+def rasterize_edges(verts, edges, extent, nx, ny):
+    """Antal kantpunkter per pixel för ett nx x ny rutnät.
+
+    Varje kant samplas med ungefär en punkt per pixel den passerar.
+    """
+
+    x0, x1, y0, y1 = extent
+
+    u = (verts[edges, 0] - x0)*nx/(x1 - x0)
+    v = (verts[edges, 1] - y0)*ny/(y1 - y0)
+
+    du = u[:, 1] - u[:, 0]
+    dv = v[:, 1] - v[:, 0]
+
+    n_samples = np.ceil(np.maximum(np.abs(du), np.abs(dv))).astype(int) + 1
+
+    edge = np.repeat(np.arange(len(edges)), n_samples)
+    t = (np.arange(n_samples.sum()) - np.repeat(
+        np.cumsum(n_samples) - n_samples, n_samples
+    ))/np.repeat(n_samples - 1, n_samples)
+
+    ix = np.clip((u[edge, 0] + t*du[edge]).astype(int), 0, nx - 1)
+    iy = np.clip((v[edge, 0] + t*dv[edge]).astype(int), 0, ny - 1)
+
+    return np.bincount(iy*nx + ix, minlength=nx*ny).reshape(ny, nx)
+
+
+class Visualisation:
+    """Klass för visualisering av resulat
+
+    Nät med fler än lod_elements element ritas med förenklad detaljnivå.
+    Nät, element- och nodvärden ritas då som bilder med samma upplösning
+    som figuren. Den förberedda geometrin och pixelindexen sparas mellan
+    anropen till show_* så länge coords och edof i output_data är samma
+    objekt.
+    """
+
+    def __init__(self, input_data, output_data):
+        """Konstruktor"""
+
+        self.input_data = input_data
+        self.output_data = output_data
+
+        self.geom_fig = None
+        self.mesh_fig = None
+        self.el_value_fig = None
+        self.node_value_fig = None
+
+        self.geom_widget = None
+        self.mesh_widget = None
+        self.el_value_widget = None
+        self.node_value_widget = None
+
+        self.lod_elements = 20000
+        self.lod_max_pixels = 2000
+
+        self.__geometry = None
+        self.__rasters = {}
+
+    def use_lod(self):
+        """Sant om nätet ska ritas med förenklad detaljnivå"""
+
+        return self.lod_elements is not None and \
+            len(self.output_data.edof) > self.lod_elements
+
+    def __prepare_geometry(self):
+        """Trianglar, kanter och utsträckning för nätet, cachad"""
+
+        coords = self.output_data.coords
+        edof = self.output_data.edof
+
+        if self.__geometry is not None and \
+                self.__geometry["coords"] is coords and \
+                self.__geometry["edof"] is edof:
+            return self.__geometry
+
+        verts, faces, vertices_per_face, is_3d = cfv.ce2vf(
+            coords, edof, self.output_data.dofs_per_node,
+            self.output_data.el_type
+        )
+
+        verts = np.asarray(verts, dtype=float)[:, :2]
+        faces = np.asarray(faces).astype(int)
+
+        # --- Fyrhörningar delas i två trianglar
+
+        if faces.shape[1] == 4:
+            triangles = np.empty((2*faces.shape[0], 3), dtype=faces.dtype)
+            triangles[0::2] = faces[:, [0, 1, 2]]
+            triangles[1::2] = faces[:, [0, 2, 3]]
+        else:
+            triangles = faces[:, :3]
+
+        # --- Unika kanter
+
+        n = faces.shape[1]
+        edges = np.concatenate(
+            [faces[:, [i, (i + 1) % n]] for i in range(n)]
+        )
+        edges = np.sort(edges, axis=1)
+        n_verts = len(verts)
+        edges = np.unique(edges[:, 0]*n_verts + edges[:, 1])
+        edges = np.c_[edges // n_verts, edges % n_verts]
+
+        self.__geometry = {
+            "coords": coords,
+            "edof": edof,
+            "verts": verts,
+            "triangles": triangles,
+            "triangles_per_element": triangles.shape[0] // faces.shape[0],
+            "edges": edges,
+            "extent": (verts[:, 0].min(), verts[:, 0].max(),
+                       verts[:, 1].min(), verts[:, 1].max())
+        }
+        self.__rasters = {}
+
+        return self.__geometry
+
+    def __raster(self, fig):
+        """Pixelindex och vikter för figurens upplösning, cachade"""
+
+        geometry = self.__prepare_geometry()
+
+        x0, x1, y0, y1 = geometry["extent"]
+
+        width, height = fig.get_size_inches()*fig.dpi*0.8
+        width = min(width, self.lod_max_pixels)
+        height = min(height, self.lod_max_pixels)
+
+        # --- Behåll geometrins proportioner
+
+        aspect = (y1 - y0)/(x1 - x0)
+
+        nx = max(int(min(width, height/aspect)), 1)
+        ny = max(int(min(height, width*aspect)), 1)
+
+        if (nx, ny) in self.__rasters:
+            return self.__rasters[(nx, ny)]
+
+        triangle, weights = rasterize_triangles(
+            geometry["verts"], geometry["triangles"], geometry["extent"],
+            nx, ny
+        )
+
+        outside = triangle < 0
+
+        raster = {
+            "outside": outside,
+            "element": np.where(
+                outside, 0, triangle // geometry["triangles_per_element"]
+            ),
+            "nodes": geometry["triangles"][np.where(outside, 0, triangle)],
+            "weights": weights,
+            "edges": rasterize_edges(
+                geometry["verts"], geometry["edges"], geometry["extent"],
+                nx, ny
+            )
+        }
+
+        self.__rasters[(nx, ny)] = raster
+
+        return raster
+
+    def __draw_image(self, image, title, **kwargs):
+        """Rita en bild över nätets utsträckning"""
+
+        import matplotlib.pyplot as plt
+
+        ax = plt.gca()
+        ax.set_aspect("equal")
+
+        im = ax.imshow(
+            image, origin="lower", extent=self.__prepare_geometry()["extent"],
+            interpolation="nearest", **kwargs
+        )
+
+        if title is not None:
+            ax.set(title=title)
+
+        return im
+
+    def draw_mesh_lod(self, title="Mesh"):
+        """Rita nätet som en bild där pixlar med kanter är mörka"""
+
+        import matplotlib.pyplot as plt
+
+        raster = self.__raster(plt.gcf())
+
+        edges = raster["edges"] > 0
+
+        image = np.ma.masked_array(
+            np.where(edges, 0.3, 0.85), raster["outside"] & ~edges
+        )
+
+        self.__draw_image(image, title, cmap="gray", vmin=0.0, vmax=1.0)
+
+    def draw_element_values_lod(self, values, title=None):
+        """Rita elementvärden som en bild med figurens upplösning"""
+
+        import matplotlib.pyplot as plt
+
+        raster = self.__raster(plt.gcf())
+
+        values = np.asarray(values, dtype=float).ravel()
+
+        image = np.ma.masked_array(
+            values[raster["element"]], raster["outside"]
+        )
+
+        im = self.__draw_image(image, title)
+        cfv.set_mappable(im)
+
+        return im
+
+    def draw_nodal_values_lod(self, a, title=None):
+        """Rita nodvärden linjärt interpolerade till en bild"""
+
+        import matplotlib.pyplot as plt
+
+        raster = self.__raster(plt.gcf())
+
+        a = np.asarray(a, dtype=float).ravel()
+
+        image = np.ma.masked_array(
+            (a[raster["nodes"]]*raster["weights"]).sum(axis=2),
+            raster["outside"]
+        )
+
+        im = self.__draw_image(image, title)
+        cfv.set_mappable(im)
+
+        return im
+
+    def show(self):
+        """Visa alla visualiseringsfönster"""
+        geometry = self.output_data.geometry
+        a = self.output_data.a
+        max_flow = self.output_data.max_flow
+        coords = self.output_data.coords
+        edof = self.output_data.edof
+        dofs_per_node = self.output_data.dofs_per_node
+        el_type = self.output_data.el_type
+
+        cfv.figure()
+        cfv.draw_geometry(geometry, title="Geometry")
+
+        lod = self.use_lod()
+
+        cfv.figure()
+        if lod:
+            self.draw_element_values_lod(max_flow, title="Max flows")
+        else:
+            cfv.draw_element_values(max_flow, coords, edof, dofs_per_node,
+                                    el_type, None, draw_elements=False,
+                                    title="Max flows")
+
+        cfv.figure()
+        if lod:
+            self.draw_mesh_lod(title="Mesh")
+        else:
+            cfv.draw_mesh(coords, edof, dofs_per_node, el_type, filled=True,
+                          title="Mesh")
+
+        cfv.figure()
+        if lod:
+            self.draw_nodal_values_lod(a, title="Nodal values")
+        else:
+            cfv.draw_nodal_values(a, coords, edof, el_type=el_type,
+                                  draw_elements=False, title="Nodal values")
+
+        cfv.colorbar()
+
+    def close_all(self):
+        """Stäng alla visualiseringsfönster"""
+
+        cfv.closeAll()
+
+        self.geom_fig = None
+        self.mesh_fig = None
+        self.el_value_fig = None
+        self.node_value_fig = None
+
+        if self.geom_widget is not None:
+            self.geom_widget.close()
+        if self.mesh_widget is not None:
+            self.mesh_widget.close()
+        if self.el_value_widget is not None:
+            self.el_value_widget.close()
+        if self.node_value_widget is not None:
+            self.node_value_widget.close()
+
+    def show_geometry(self, no_show=False):
+        """Visa geometri visualisering"""
+
+        geometry = self.output_data.geometry
+
+        self.geom_fig = cfv.figure(self.geom_fig)
+
+        if self.geom_widget is None:
+            self.geom_widget = cfv.figure_widget(self.geom_fig)
+
+        cfv.clf()
+        cfv.draw_geometry(geometry, title="Geometry")
+
+        if no_show:
+            return self.geom_widget
+
+        self.geom_widget.show()
+
+        return None
+
+    def show_mesh(self, no_show=False):
+        """Visa nät visualisering"""
+
+        coords = self.output_data.coords
+        edof = self.output_data.edof
+        dofs_per_node = self.output_data.dofs_per_node
+        el_type = self.output_data.el_type
+
+        self.mesh_fig = cfv.figure(self.mesh_fig)
+
+        if self.mesh_widget is None:
+            self.mesh_widget = cfv.figure_widget(self.mesh_fig)
+
+        cfv.clf()
+        if self.use_lod():
+            self.draw_mesh_lod(title="Mesh")
+        else:
+            cfv.draw_mesh(coords, edof, dofs_per_node, el_type, filled=True,
+                          title="Mesh")
+
+        if no_show:
+            return self.mesh_widget
+
+        self.mesh_widget.show()
+
+        return None
+
+    def show_nodal_values(self, no_show=False):
+        """Visa nodvärden"""
+
+        a = self.output_data.a
+        coords = self.output_data.coords
+        edof = self.output_data.edof
+        dofs_per_node = self.output_data.dofs_per_node
+        el_type = self.output_data.el_type
+
+        self.node_value_fig = cfv.figure(self.node_value_fig)
+
+        if self.node_value_widget is None:
+            self.node_value_widget = cfv.figure_widget(self.node_value_fig)
+
+        cfv.clf()
+        if self.use_lod():
+            self.draw_nodal_values_lod(a, title="Nodal values")
+        else:
+            cfv.draw_nodal_values(a, coords, edof, dofs_per_node=dofs_per_node,
+                                  el_type=el_type, draw_elements=False,
+                                  title="Nodal values")
+
+        if no_show:
+            return self.node_value_widget
+
+        self.node_value_widget.show()
+
+        return None
+
+    def show_element_values(self, no_show=False):
+        """Visa elementvärden"""
+
+        max_flow = self.output_data.max_flow
+        coords = self.output_data.coords
+        edof = self.output_data.edof
+        dofs_per_node = self.output_data.dofs_per_node
+        el_type = self.output_data.el_type
+
+        self.el_value_fig = cfv.figure(self.el_value_fig)
+
+        if self.el_value_widget is None:
+            self.el_value_widget = cfv.figure_widget(self.el_value_fig)
+
+        cfv.clf()
+        if self.use_lod():
+            self.draw_element_values_lod(max_flow, title="Max flows")
+        else:
+            cfv.draw_element_values(max_flow, coords, edof, dofs_per_node,
+                                    el_type, None, draw_elements=False,
+                                    title="Max flows")
+
+        if no_show:
+            return self.el_value_widget
+
+        self.el_value_widget.show()
+
+        return None
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+import tempmodel2 as tm
+
+def make_model():
+    """TempModel med små syntetiska resultat, utan nätgenerering."""
+
+    temp_model = tm.TempModel()
+    output_data = temp_model.output_data
+
+    rng = np.random.default_rng(0)
+
+    output_data.coords = rng.uniform(size=(9, 2))
+    output_data.edof = np.array([[1, 2, 5, 4], [2, 3, 6, 5],
+                                 [4, 5, 8, 7], [5, 6, 9, 8]])
+    output_data.a = rng.uniform(size=(9, 1))
+    output_data.r = rng.uniform(size=(9, 1))
+    output_data.ed = rng.uniform(size=(4, 4))
+    output_data.qs = rng.uniform(size=(4, 4, 2))
+    output_data.qt = rng.uniform(size=(4, 4, 2))
+    output_data.max_flow = rng.uniform(size=4)
+    output_data.flow = rng.uniform(size=(4, 2))
+    output_data.dofs_per_node = 1
+    output_data.el_type = 3
+    output_data.bdofs = {80: np.array([1, 2, 3]), 90: np.array([7, 8, 9])}
+
+    return temp_model
+
+def assert_same_results(output_data, expected):
+    for name, value in expected.to_arrays().items():
+        np.testing.assert_array_equal(
+            output_data.to_arrays()[name], value, err_msg=name
+        )
+
+@pytest.mark.parametrize("compressed, mmap_mode", [
+    (True, None), (False, None), (False, "r")
+])
+def test_save_to_loaded_file(tmp_path, compressed, mmap_mode):
+    """load("res.npz") följt av save("res.npz") får inte förstöra filen."""
+
+    filename = str(tmp_path / "res.npz")
+
+    expected = make_model()
+    expected.save(filename, compressed)
+
+    temp_model = tm.TempModel()
+    temp_model.load(filename, mmap_mode)
+    temp_model.save(filename, compressed)
+
+    reloaded = tm.TempModel()
+    reloaded.load(filename)
+
+    assert_same_results(reloaded.output_data, expected.output_data)
+    assert reloaded.input_data.to_dict() == expected.input_data.to_dict()
+
+    # --- Inga temporära filer kvar
+
+    assert [path.name for path in tmp_path.iterdir()] == ["res.npz"]
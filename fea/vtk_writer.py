@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+import numpy as np
+
+VTK_TRIANGLE = 5
+VTK_QUAD = 9
+
+VTK_FORMATS = ("ascii", "binary", "vtu")
+
+def vtk_extension(fmt):
+    """Filändelse för ett VTK-format."""
+
+    if fmt == "vtu":
+        return ".vtu"
+
+    return ".vtk"
+
+def _points3d(points):
+    """Nodkoordinater som (n, 3), z = 0 för 2D-nät."""
+
+    points = np.asarray(points, float)
+    if points.shape[1] == 3:
+        return points
+
+    points3d = np.zeros([points.shape[0], 3])
+    points3d[:, 0:points.shape[1]] = points
+    return points3d
+
+def _legacy_type(data):
+    """VTK-typnamn och big-endian dtype för en dataarray."""
+
+    if data.dtype == np.float32:
+        return "float", ">f4"
+    return "double", ">f8"
+
+def write_legacy_binary(filename, points, cells, point_data=None,
+                        cell_data=None, title="Temperature model results"):
+    """Skriv ett legacy VTK POLYDATA-nät binärt direkt från NumPy-arrayer.
+
+    cells är nodindex med nollbas, (nel, nen). point_data och cell_data
+    är dicts namn -> array, 1D-arrayer blir SCALARS och (n, 3) VECTORS.
+    """
+
+    points = _points3d(points)
+    cells = np.asarray(cells)
+    n_el, nen = cells.shape
+
+    polygons = np.empty([n_el, nen + 1], ">i4")
+    polygons[:, 0] = nen
+    polygons[:, 1:] = cells
+
+    with open(filename, "wb") as f:
+        f.write(("# vtk DataFile Version 2.0\n%s\nBINARY\n" % title).encode())
+        f.write(b"DATASET POLYDATA\n")
+        f.write(("POINTS %d float\n" % points.shape[0]).encode())
+        f.write(points.astype(">f4").tobytes())
+        f.write(("\nPOLYGONS %d %d\n" % (n_el, polygons.size)).encode())
+        f.write(polygons.tobytes())
+        f.write(b"\n")
+
+        for section, n, data in (("CELL_DATA", n_el, cell_data),
+                                 ("POINT_DATA", points.shape[0], point_data)):
+            if not data:
+                continue
+
+            f.write(("%s %d\n" % (section, n)).encode())
+
+            for name, values in data.items():
+                values = np.asarray(values)
+                vtk_type, big_endian = _legacy_type(values)
+
+                if values.ndim == 2 and values.shape[1] == 3:
+                    f.write(("VECTORS %s %s\n" % (name, vtk_type)).encode())
+                else:
+                    f.write(("SCALARS %s %s 1\nLOOKUP_TABLE default\n"
+                             % (name, vtk_type)).encode())
+
+                f.write(values.astype(big_endian).tobytes())
+                f.write(b"\n")
+
+def write_vtu(filename, points, cells, point_data=None, cell_data=None):
+    """Skriv ett VTK XML UnstructuredGrid (.vtu) med rå, appendad data.
+
+    Arrayerna skrivs oförändrade efter XML-huvudet utan omvandling till
+    listor eller text. Argumenten är desamma som för write_legacy_binary.
+    """
+
+    points = _points3d(points)
+    cells = np.asarray(cells)
+    n_el, nen = cells.shape
+
+    if nen == 4:
+        cell_type = VTK_QUAD
+    elif nen == 3:
+        cell_type = VTK_TRIANGLE
+    else:
+        raise ValueError("Unsupported number of element nodes: %d" % nen)
+
+    blocks = []
+
+    def data_array(name, values, n_components=1):
+        values = np.ascontiguousarray(values)
+        values = values.astype(values.dtype.newbyteorder("<"), copy=False)
+        offset = sum(8 + block.nbytes for block in blocks)
+        blocks.append(values)
+
+        vtk_type = {
+            "f4": "Float32", "f8": "Float64", "i4": "Int32", "i8": "Int64",
+            "u1": "UInt8"
+        }[values.dtype.str[1:]]
+
+        return ('<DataArray type="%s" Name="%s" NumberOfComponents="%d" '
+                'format="appended" offset="%d"/>\n'
+                % (vtk_type, name, n_components, offset))
+
+    def field_arrays(data):
+        xml = ""
+        for name, values in (data or {}).items():
+            values = np.asarray(values)
+            n_components = 1 if values.ndim == 1 else values.shape[1]
+            xml += data_array(name, values, n_components)
+        return xml
+
+    xml = '<?xml version="1.0"?>\n'
+    xml += ('<VTKFile type="UnstructuredGrid" version="1.0" '
+            'byte_order="LittleEndian" header_type="UInt64">\n')
+    xml += '<UnstructuredGrid>\n'
+    xml += ('<Piece NumberOfPoints="%d" NumberOfCells="%d">\n'
+            % (points.shape[0], n_el))
+    xml += '<PointData>\n' + field_arrays(point_data) + '</PointData>\n'
+    xml += '<CellData>\n' + field_arrays(cell_data) + '</CellData>\n'
+    xml += '<Points>\n' + data_array("Points", points, 3) + '</Points>\n'
+    xml += '<Cells>\n'
+    xml += data_array("connectivity", cells.astype(np.int64).ravel())
+    xml += data_array("offsets", np.arange(1, n_el + 1, dtype=np.int64)*nen)
+    xml += data_array("types", np.full(n_el, cell_type, np.uint8))
+    xml += '</Cells>\n'
+    xml += '</Piece>\n'
+    xml += '</UnstructuredGrid>\n'
+    xml += '<AppendedData encoding="raw">\n_'
+
+    with open(filename, "wb") as f:
+        f.write(xml.encode())
+        for block in blocks:
+            f.write(np.array(block.nbytes, "<u8").tobytes())
+            f.write(block.tobytes())
+        f.write(b"\n</AppendedData>\n</VTKFile>\n")
+
+
+class XdmfSeriesWriter:
+    """Skriver en serie resultat som en XDMF-fil med tidsaxel.
+
+    All data skrivs rått till två binärfiler, <basename>_mesh.bin och
+    <basename>_data.bin, som XDMF-filen refererar med byteoffset. Ett nät
+    skrivs bara en gång och delas av alla steg som använder det.
+    """
+
+    def __init__(self, basename):
+        self.xdmf_filename = basename + ".xdmf"
+        self.mesh_filename = basename + "_mesh.bin"
+        self.data_filename = basename + "_data.bin"
+
+        self.meshes = {}
+        self.steps = []
+
+        for filename in (self.mesh_filename, self.data_filename):
+            open(filename, "wb").close()
+
+    def _append(self, filename, values):
+        """Lägg till en array sist i filename och returnera dess beskrivning."""
+
+        values = np.ascontiguousarray(values)
+        values = values.astype(values.dtype.newbyteorder("<"), copy=False)
+
+        with open(filename, "ab") as f:
+            offset = f.tell()
+            f.write(values.tobytes())
+
+        return {
+            "filename": os.path.basename(filename),
+            "offset": offset,
+            "shape": values.shape,
+            "kind": "Float" if values.dtype.kind == "f" else "Int",
+            "precision": values.dtype.itemsize
+        }
+
+    def add_step(self, time, points, cells, point_data=None, cell_data=None):
+        """Lägg till ett steg. Argumenten är desamma som för write_vtu."""
+
+        points = np.asarray(points, float)
+        cells = np.asarray(cells, np.int64)
+
+        mesh_key = hashlib.sha1(points.tobytes() + cells.tobytes()).hexdigest()
+
+        if mesh_key not in self.meshes:
+            self.meshes[mesh_key] = {
+                "geometry": self._append(self.mesh_filename, points),
+                "topology": self._append(self.mesh_filename, cells)
+            }
+
+        fields = []
+        for center, data in (("Node", point_data), ("Cell", cell_data)):
+            for name, values in (data or {}).items():
+                values = np.asarray(values, float)
+                if values.ndim == 2 and values.shape[1] == 1:
+                    values = values.ravel()
+                fields.append((name, center, self._append(
+                    self.data_filename, values
+                )))
+
+        self.steps.append((time, self.meshes[mesh_key], fields))
+
+        self.write_xdmf()
+
+    def _data_item(self, item):
+        return (
+            '<DataItem Format="Binary" NumberType="%s" Precision="%d" '
+            'Endian="Little" Seek="%d" Dimensions="%s">%s</DataItem>\n'
+            % (item["kind"], item["precision"], item["offset"],
+               " ".join(str(n) for n in item["shape"]), item["filename"])
+        )
+
+    def write_xdmf(self):
+        xml = '<?xml version="1.0"?>\n'
+        xml += '<Xdmf Version="3.0">\n<Domain>\n'
+        xml += ('<Grid Name="series" GridType="Collection" '
+                'CollectionType="Temporal">\n')
+
+        for time, mesh, fields in self.steps:
+            geometry = mesh["geometry"]
+            topology = mesh["topology"]
+            n_el, nen = topology["shape"]
+
+            xml += '<Grid Name="mesh" GridType="Uniform">\n'
+            xml += '<Time Value="%.16g"/>\n' % time
+            xml += ('<Topology TopologyType="%s" NumberOfElements="%d">\n'
+                    % ("Quadrilateral" if nen == 4 else "Triangle", n_el))
+            xml += self._data_item(topology)
+            xml += '</Topology>\n'
+            xml += ('<Geometry GeometryType="%s">\n'
+                    % ("XYZ" if geometry["shape"][1] == 3 else "XY"))
+            xml += self._data_item(geometry)
+            xml += '</Geometry>\n'
+
+            for name, center, item in fields:
+                attribute_type = "Vector" if len(item["shape"]) == 2 and \
+                    item["shape"][1] == 3 else "Scalar"
+                xml += ('<Attribute Name="%s" AttributeType="%s" '
+                        'Center="%s">\n' % (name, attribute_type, center))
+                xml += self._data_item(item)
+                xml += '</Attribute>\n'
+
+            xml += '</Grid>\n'
+
+        xml += '</Grid>\n</Domain>\n</Xdmf>\n'
+
+        tmp_filename = self.xdmf_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            f.write(xml)
+        os.replace(tmp_filename, self.xdmf_filename)
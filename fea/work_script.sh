@@ -15,7 +15,7 @@ cd $JOB_DIR
 
 # run the program
 export PYTHONPATH=..:$PYTHONPATH
-../cfpython ../fe-temp-sim.py temp_model_${WRK_NB}.json temp_model_results_${WRK_NB}.json temp_model_results_${WRK_NB}.vtk
+../cfpython ../fe-temp-sim.py --mesh-cache --result-cache-dir $SLURM_SUBMIT_DIR/result_cache --vtk-format binary temp_model_${WRK_NB}.json temp_model_results_${WRK_NB}.json temp_model_results_${WRK_NB}.vtk
 
 # Copy the vtk files to the main directory
 cp temp_model_results_${WRK_NB}.vtk ${VIS_DIR}
\ No newline at end of file
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import shlex
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+SRUN_COMMAND = ["srun", "-Q", "--exclusive", "--overlap", "-n", "1", "-N", "1"]
+
+def read_ini(filename):
+    """Läs en POV-Ray .ini-fil till en dict med Nyckel=värde."""
+
+    options = {}
+
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.split(";", 1)[0].strip()
+            if "=" in line:
+                key, value = line.split("=", 1)
+                options[key.strip()] = value.strip()
+
+    return options
+
+def split_tiles(width, height, rows, columns):
+    """Dela bilden i rows x columns rutor (start_row, end_row, start_col, end_col).
+
+    Rader och kolumner räknas från 1 som i POV-Ray och intervallen är
+    inklusive. Rutorna ordnas rad för rad uppifrån.
+    """
+
+    def bounds(n, parts):
+        edges = [round(i*n/parts) for i in range(parts + 1)]
+        return [(edges[i] + 1, edges[i + 1]) for i in range(parts)
+                if edges[i + 1] > edges[i]]
+
+    return [
+        (start_row, end_row, start_col, end_col)
+        for start_row, end_row in bounds(height, rows)
+        for start_col, end_col in bounds(width, columns)
+    ]
+
+def pixel_arg(n):
+    """Pixelnummer som argument till +SR/+ER/+SC/+EC.
+
+    POV-Ray tolkar värden mellan 0 och 1 som andelar av bilden, så
+    första pixeln anges som 0 och inte som 1.
+    """
+
+    return "0" if n == 1 else "%d" % n
+
+def tile_filename(tile_dir, index):
+    return os.path.join(tile_dir, "tile_%04d.ppm" % index)
+
+def read_ppm(filename):
+    """Läs en binär PPM-bild (P6).
+
+    Returnerar (bredd, höjd, rgb) där rgb är råa RGB-bytes med 8 bitar
+    per färg, rad för rad uppifrån.
+    """
+
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    fields = []
+    pos = 0
+
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos)
+            continue
+        end = pos
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+
+    if fields[0] != b"P6":
+        raise ValueError("%s is not a binary PPM file" % filename)
+
+    width, height, maxval = [int(field) for field in fields[1:]]
+    pos += 1
+
+    n_bytes = width*height*3*(1 if maxval < 256 else 2)
+    rgb = data[pos:pos + n_bytes]
+
+    if len(rgb) != n_bytes:
+        raise ValueError("%s is truncated" % filename)
+
+    # --- 16 bitar per färg lagras med den mest signifikanta byten först
+
+    if maxval >= 256:
+        rgb = rgb[0::2]
+
+    return width, height, rgb
+
+def write_png(filename, width, height, rgb):
+    """Skriv råa RGB-bytes som PNG utan radfilter."""
+
+    def chunk(kind, payload):
+        return (struct.pack(">I", len(payload)) + kind + payload +
+                struct.pack(">I", zlib.crc32(kind + payload) & 0xffffffff))
+
+    stride = width*3
+    raw = b"".join(
+        b"\x00" + rgb[row*stride:(row + 1)*stride] for row in range(height)
+    )
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2,
+                                           0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+
+def tile_region(image, tile, width, height):
+    """Rutans RGB-bytes ur en renderad delbild (bredd, höjd, rgb).
+
+    Beroende på version skriver POV-Ray antingen bara det renderade
+    området eller hela bilden med resten svart, så båda hanteras.
+    """
+
+    image_width, image_height, rgb = image
+
+    start_row, end_row, start_col, end_col = tile
+
+    tile_height = end_row - start_row + 1
+    tile_width = end_col - start_col + 1
+
+    full_rows = image_height == height and tile_height != height
+    full_cols = image_width == width and tile_width != width
+
+    row_offset = start_row - 1 if full_rows else 0
+    col_offset = start_col - 1 if full_cols else 0
+
+    if (not full_rows and image_height != tile_height) or \
+            (not full_cols and image_width != tile_width) or \
+            len(rgb) != image_width*image_height*3:
+        raise ValueError(
+            "Tile %s has size %dx%d, expected %dx%d"
+            % (tile, image_width, image_height, tile_width, tile_height)
+        )
+
+    stride = image_width*3
+
+    return b"".join(
+        rgb[row*stride + col_offset*3:row*stride + (col_offset + tile_width)*3]
+        for row in range(row_offset, row_offset + tile_height)
+    )
+
+def stitch(tiles, tile_dir, width, height):
+    """Sätt ihop de renderade rutorna till RGB-bytes för hela bilden."""
+
+    image = bytearray(width*height*3)
+    stride = width*3
+
+    for index, tile in enumerate(tiles):
+        start_row, end_row, start_col, end_col = tile
+
+        rgb = tile_region(
+            read_ppm(tile_filename(tile_dir, index)), tile, width, height
+        )
+
+        tile_stride = (end_col - start_col + 1)*3
+
+        for i, row in enumerate(range(start_row - 1, end_row)):
+            offset = row*stride + (start_col - 1)*3
+            image[offset:offset + tile_stride] = \
+                rgb[i*tile_stride:(i + 1)*tile_stride]
+
+    return bytes(image)
+
+
+class TileRenderer:
+    """Renderar en bild som oberoende rutor och sätter ihop dem.
+
+    Backend "local" kör povray-processerna lokalt, n_workers åt gången,
+    och "slurm" startar varje ruta med srun i den aktuella allokeringen
+    så att rutorna kan fördelas över flera noder. Rutor som redan finns
+    i tile_dir och har rätt storlek renderas inte om.
+    """
+
+    def __init__(self, ini_filename, rows=2, columns=2, n_workers=1,
+                 backend="local", threads=None, tile_dir="tiles",
+                 povray="povray", extra_args=None):
+        self.ini_filename = ini_filename
+        self.rows = rows
+        self.columns = columns
+        self.n_workers = n_workers
+        self.backend = backend
+        self.threads = threads
+        self.tile_dir = tile_dir
+        self.povray = povray
+        self.extra_args = extra_args or []
+
+        if backend not in ("local", "slurm"):
+            raise ValueError("Unknown backend: %s" % backend)
+
+        options = read_ini(ini_filename)
+
+        self.width = int(options.get("Width", 320))
+        self.height = int(options.get("Height", 240))
+
+        for arg in self.extra_args:
+            if arg[:2].upper() == "+W" and arg[2:].isdigit():
+                self.width = int(arg[2:])
+            elif arg[:2].upper() == "+H" and arg[2:].isdigit():
+                self.height = int(arg[2:])
+
+        self.tiles = split_tiles(self.width, self.height, rows, columns)
+
+    def tile_command(self, index):
+        start_row, end_row, start_col, end_col = self.tiles[index]
+
+        command = [
+            self.povray, self.ini_filename, *self.extra_args,
+            "+SR%s" % pixel_arg(start_row), "+ER%s" % pixel_arg(end_row),
+            "+SC%s" % pixel_arg(start_col), "+EC%s" % pixel_arg(end_col),
+            "-D", "+FP", "+O%s" % tile_filename(self.tile_dir, index)
+        ]
+
+        if self.threads is not None:
+            command.append("+WT%d" % self.threads)
+
+        if self.backend == "slurm":
+            srun = list(SRUN_COMMAND)
+            if self.threads is not None:
+                srun += ["-c", "%d" % self.threads]
+            return srun + command
+
+        return command
+
+    def tile_done(self, index):
+        """Sant om rutan redan är renderad och har rätt storlek."""
+
+        try:
+            tile_region(
+                read_ppm(tile_filename(self.tile_dir, index)),
+                self.tiles[index], self.width, self.height
+            )
+        except (OSError, ValueError, IndexError):
+            return False
+
+        return True
+
+    def render_tile(self, index):
+        start = time.time()
+
+        log_filename = os.path.join(self.tile_dir, "tile_%04d.log" % index)
+
+        with open(log_filename, "w") as log:
+            try:
+                returncode = subprocess.call(
+                    self.tile_command(index), stdout=log,
+                    stderr=subprocess.STDOUT
+                )
+            except OSError as e:
+                log.write("Could not start povray: %s\n" % e)
+                returncode = -1
+
+        if returncode == 0 and not self.tile_done(index):
+            returncode = -1
+
+        print("Tile %d of %d finished with status %d in %.1f s."
+              % (index + 1, len(self.tiles), returncode, time.time() - start))
+        sys.stdout.flush()
+
+        return returncode
+
+    def render(self):
+        """Rendera alla rutor som saknas och returnera de som misslyckades."""
+
+        os.makedirs(self.tile_dir, exist_ok=True)
+
+        todo = [
+            index for index in range(len(self.tiles))
+            if not self.tile_done(index)
+        ]
+
+        print("Rendering %d of %d tiles on %d workers (%s)..."
+              % (len(todo), len(self.tiles), self.n_workers, self.backend))
+        sys.stdout.flush()
+
+        with ThreadPoolExecutor(max_workers=max(self.n_workers, 1)) as pool:
+            returncodes = list(pool.map(self.render_tile, todo))
+
+        return [
+            index for index, returncode in zip(todo, returncodes)
+            if returncode != 0
+        ]
+
+    def stitch(self):
+        return stitch(self.tiles, self.tile_dir, self.width, self.height)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Render a POV-Ray scene as tiles and stitch them to a PNG."
+    )
+    parser.add_argument("ini", help="POV-Ray .ini file, e.g. benchmark.ini")
+    parser.add_argument("--output", default="render.png")
+    parser.add_argument(
+        "--tiles", default="4x1",
+        help="ROWSxCOLUMNS, number of tiles to split the image in "
+        "(default: 4x1)"
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.environ.get("SLURM_NTASKS", 1)),
+        help="number of tiles rendered at the same time "
+        "(default: $SLURM_NTASKS)"
+    )
+    parser.add_argument(
+        "--backend", choices=("local", "slurm"), default="local"
+    )
+    parser.add_argument(
+        "--threads", type=int,
+        default=int(os.environ["SLURM_CPUS_PER_TASK"])
+        if "SLURM_CPUS_PER_TASK" in os.environ else None,
+        help="povray threads per tile (+WT, default: $SLURM_CPUS_PER_TASK)"
+    )
+    parser.add_argument("--tile-dir", default="tiles")
+    parser.add_argument("--povray", default="povray")
+    parser.add_argument(
+        "--povray-args", default="",
+        help="extra povray options, e.g. '+W1920 +H1080 +A'"
+    )
+    parser.add_argument(
+        "--keep-tiles", action="store_true",
+        help="keep the tile images after stitching"
+    )
+    args = parser.parse_args()
+
+    rows, columns = [int(n) for n in args.tiles.lower().split("x")]
+
+    renderer = TileRenderer(
+        args.ini, rows, columns, args.workers, args.backend, args.threads,
+        args.tile_dir, args.povray, shlex.split(args.povray_args)
+    )
+
+    t0 = time.time()
+    failed = renderer.render()
+
+    if failed:
+        print("Failed tiles: %s, see %s/tile_*.log"
+              % (" ".join(str(index) for index in failed), args.tile_dir))
+        sys.exit(1)
+
+    write_png(args.output, renderer.width, renderer.height, renderer.stitch())
+
+    print("Wrote %dx%d image to %s in %.1f s."
+          % (renderer.width, renderer.height, args.output, time.time() - t0))
+
+    if not args.keep_tiles:
+        for index in range(len(renderer.tiles)):
+            os.remove(tile_filename(args.tile_dir, index))
@@ -0,0 +1,22 @@
+#!/bin/bash
+
+#SBATCH -t 00:20:00
+#SBATCH -N 2
+#SBATCH --tasks-per-node=4
+#SBATCH --cpus-per-task=5
+#SBATCH -J tut_povray_tiles
+#SBATCH -o povray_tiles_%j.out
+#SBATCH -e povray_tiles_%j.err
+
+ml GCC/10.2.0
+ml POV-Ray/3.7.0.8
+
+# each tile is rendered by its own povray process, started with srun so
+# the tiles are spread over all nodes in the allocation. every povray
+# process uses $SLURM_CPUS_PER_TASK threads.
+#
+# tiles already rendered in tiles_$SLURM_JOB_ID are skipped, so a job
+# that ran out of time can be resumed with --tile-dir pointing there.
+
+python3 render_tiles.py benchmark.ini --backend slurm --tiles 8x1 \
+    --tile-dir tiles_$SLURM_JOB_ID --output povray_$SLURM_JOB_ID.png
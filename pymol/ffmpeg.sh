@@ -0,0 +1,9 @@
+#!/bin/bash
+# runs ffmpeg with its own modules, FFmpeg and POV-Ray need different
+# toolchains so they cannot be loaded in the same environment
+
+ml purge
+ml GCCcore/11.2.0
+ml FFmpeg/4.3.2
+
+exec ffmpeg "$@"
@@ -0,0 +1,598 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import queue
+import shlex
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+SRUN_COMMAND = ["srun", "-Q", "--exclusive", "--overlap", "-n", "1", "-N", "1"]
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+def read_ini(filename):
+    """Läs en POV-Ray .ini-fil till en dict med Nyckel=värde."""
+
+    options = {}
+
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.split(";", 1)[0].strip()
+            if "=" in line:
+                key, value = line.split("=", 1)
+                options[key.strip()] = value.strip()
+
+    return options
+
+def png_valid(filename, width=None, height=None):
+    """Sant om filen är en komplett PNG-bild med rätt storlek.
+
+    Bara signaturen, IHDR och den avslutande IEND-chunken kontrolleras,
+    vilket räcker för att känna igen avbrutna eller halvskrivna bilder.
+    """
+
+    try:
+        with open(filename, "rb") as f:
+            head = f.read(24)
+            f.seek(-len(PNG_IEND), os.SEEK_END)
+            tail = f.read()
+    except OSError:
+        return False
+
+    if len(head) < 24 or head[:8] != PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return False
+
+    if tail != PNG_IEND:
+        return False
+
+    png_width, png_height = struct.unpack(">II", head[16:24])
+
+    return (width is None or png_width == width) and \
+        (height is None or png_height == height)
+
+def read_ppm_stream(f):
+    """Läs nästa binära PPM-bild (P6) från strömmen f.
+
+    Returnerar (bredd, höjd, rgb) där rgb är råa RGB-bytes med 8 bitar
+    per färg, eller None när strömmen är slut.
+    """
+
+    fields = []
+    token = b""
+
+    while len(fields) < 4:
+        c = f.read(1)
+        if not c:
+            if fields or token:
+                raise ValueError("Truncated PPM header")
+            return None
+        if c == b"#" and not token:
+            f.readline()
+        elif c.isspace():
+            if token:
+                fields.append(token)
+                token = b""
+        else:
+            token += c
+
+    if fields[0] != b"P6":
+        raise ValueError("Not a binary PPM image")
+
+    width, height, maxval = [int(field) for field in fields[1:]]
+
+    n_bytes = width*height*3*(1 if maxval < 256 else 2)
+    data = f.read(n_bytes)
+
+    if len(data) != n_bytes:
+        raise ValueError("Truncated PPM image")
+
+    # --- 16 bitar per färg lagras med den mest signifikanta byten först
+
+    if maxval >= 256:
+        data = data[0::2]
+
+    return width, height, data
+
+def write_png(filename, width, height, rgb):
+    """Skriv råa RGB-bytes som PNG utan radfilter, via en temporär fil."""
+
+    def chunk(kind, payload):
+        return (struct.pack(">I", len(payload)) + kind + payload +
+                struct.pack(">I", zlib.crc32(kind + payload) & 0xffffffff))
+
+    stride = width*3
+    raw = b"".join(
+        b"\x00" + rgb[row*stride:(row + 1)*stride] for row in range(height)
+    )
+
+    tmp_filename = filename + ".tmp"
+
+    with open(tmp_filename, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2,
+                                           0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+
+    os.replace(tmp_filename, filename)
+
+def split_subsets(frames, chunk_size):
+    """Dela ramarna i sammanhängande delmängder (start, end) med högst chunk_size ramar."""
+
+    subsets = []
+
+    for frame in frames:
+        if subsets and subsets[-1][1] == frame - 1 and \
+                frame - subsets[-1][0] < chunk_size:
+            subsets[-1] = (subsets[-1][0], frame)
+        else:
+            subsets.append((frame, frame))
+
+    return subsets
+
+
+class FrameFarm:
+    """Renderar en POV-Ray-animation som delmängder av ramar parallellt.
+
+    Varje delmängd renderas av en egen povray-process med +SF/+EF
+    (Subset_Start_Frame/Subset_End_Frame). Backend "local" kör
+    processerna lokalt och "slurm" startar dem med srun. Ramar vars
+    PNG-fil redan finns och är giltig renderas inte om. Om output är
+    satt matas ramarna till ffmpeg i ordning så fort de är klara, så
+    kodningen pågår medan resten av ramarna renderas.
+    """
+
+    def __init__(self, ini_filename, n_workers=1, backend="local",
+                 chunk_size=1, threads=None, povray="povray",
+                 ffmpeg="ffmpeg", framerate=10, output=None,
+                 extra_args=None, log_dir="frame_logs"):
+        self.ini_filename = ini_filename
+        self.n_workers = n_workers
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.threads = threads
+        self.povray = shlex.split(povray)
+        self.ffmpeg = shlex.split(ffmpeg)
+        self.framerate = framerate
+        self.output = output
+        self.extra_args = extra_args or []
+        self.log_dir = log_dir
+
+        if backend not in ("local", "slurm"):
+            raise ValueError("Unknown backend: %s" % backend)
+
+        options = read_ini(ini_filename)
+
+        self.width = int(options.get("Width", 320))
+        self.height = int(options.get("Height", 240))
+
+        for arg in self.extra_args:
+            if arg[:2].upper() == "+W" and arg[2:].isdigit():
+                self.width = int(arg[2:])
+            elif arg[:2].upper() == "+H" and arg[2:].isdigit():
+                self.height = int(arg[2:])
+
+        self.initial_frame = int(options.get("Initial_Frame", 1))
+        self.final_frame = int(options.get("Final_Frame", 1))
+
+        first = int(options.get("Subset_Start_Frame", self.initial_frame))
+        last = int(options.get("Subset_End_Frame", self.final_frame))
+
+        self.frames = list(range(max(first, self.initial_frame),
+                                 min(last, self.final_frame) + 1))
+
+        self.output_file_name = options.get(
+            "Output_File_Name",
+            os.path.splitext(options.get("Input_File_Name", "image"))[0]
+        )
+
+        self.failed = set()
+        self.rendering_done = False
+        self.encoded = 0
+        self.encode_returncode = None
+        self.encoding_done = False
+        self.condition = threading.Condition()
+
+    def frame_filename(self, frame):
+        """Filnamnet POV-Ray ger ramen, t.ex. 2hbs07.png för 30 ramar."""
+
+        root, ext = os.path.splitext(self.output_file_name)
+
+        return "%s%0*d%s" % (root, len(str(self.final_frame)), frame,
+                             ext or ".png")
+
+    def frame_done(self, frame):
+        return png_valid(self.frame_filename(frame), self.width, self.height)
+
+    def subset_command(self, subset):
+        start, end = subset
+
+        command = self.povray + [
+            self.ini_filename, *self.extra_args,
+            "+SF%d" % start, "+EF%d" % end, "-D"
+        ]
+
+        if self.threads is not None:
+            command.append("+WT%d" % self.threads)
+
+        if self.backend == "slurm":
+            srun = list(SRUN_COMMAND)
+            if self.threads is not None:
+                srun += ["-c", "%d" % self.threads]
+            return srun + command
+
+        return command
+
+    def render_subset(self, subset):
+        start, end = subset
+
+        t0 = time.time()
+
+        log_filename = os.path.join(
+            self.log_dir, "frames_%d-%d.log" % (start, end)
+        )
+
+        with open(log_filename, "w") as log:
+            try:
+                returncode = subprocess.call(
+                    self.subset_command(subset), stdout=log,
+                    stderr=subprocess.STDOUT
+                )
+            except OSError as e:
+                log.write("Could not start povray: %s\n" % e)
+                returncode = -1
+
+        failed = [
+            frame for frame in range(start, end + 1)
+            if not self.frame_done(frame)
+        ]
+
+        with self.condition:
+            self.failed.update(failed)
+            self.condition.notify_all()
+
+        print("Frames %d-%d finished with status %d in %.1f s%s."
+              % (start, end, returncode, time.time() - t0,
+                 ", %d frames missing" % len(failed) if failed else ""))
+        sys.stdout.flush()
+
+    def worker(self, subset_queue):
+        while True:
+            try:
+                subset = subset_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            self.render_subset(subset)
+
+    def encode_command(self):
+        return self.ffmpeg + [
+            "-y", "-f", "image2pipe", "-framerate", "%g" % self.framerate,
+            "-c:v", "png", "-i", "-", "-pix_fmt", "yuv420p", self.output
+        ]
+
+    def wait_for_frame(self, frame):
+        """Vänta tills ramen är klar. Returnerar False om den aldrig blir det."""
+
+        with self.condition:
+            while True:
+                if self.frame_done(frame):
+                    return True
+                if frame in self.failed or self.rendering_done:
+                    return False
+
+                # --- Ramar blir klara mitt i en delmängd, så titta igen
+                #     med jämna mellanrum även utan notifiering
+
+                self.condition.wait(1.0)
+
+    def encode(self):
+        """Mata ramarna i ordning till ffmpeg medan de renderas."""
+
+        encoded = 0
+
+        with open(os.path.join(self.log_dir, "ffmpeg.log"), "w") as log:
+            process = subprocess.Popen(
+                self.encode_command(), stdin=subprocess.PIPE, stdout=log,
+                stderr=subprocess.STDOUT
+            )
+
+            try:
+                for frame in self.frames:
+                    if not self.wait_for_frame(frame):
+                        print("Frame %d is missing, encoding stopped after "
+                              "%d frames." % (frame, encoded))
+                        break
+
+                    process.stdin.write(self.frame_data(frame))
+
+                    encoded += 1
+            except BrokenPipeError:
+                print("ffmpeg exited early, see %s."
+                      % os.path.join(self.log_dir, "ffmpeg.log"))
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                returncode = process.wait()
+
+        with self.condition:
+            self.encoding_done = True
+            self.condition.notify_all()
+
+        self.encode_returncode = returncode
+        self.encoded = encoded
+
+    def frame_data(self, frame):
+        with open(self.frame_filename(frame), "rb") as f:
+            return f.read()
+
+    def run(self):
+        """Rendera saknade ramar, koda video och returnera saknade ramar."""
+
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        todo = [frame for frame in self.frames if not self.frame_done(frame)]
+        subsets = split_subsets(todo, self.chunk_size)
+
+        print("Rendering %d of %d frames as %d subsets on %d workers (%s)..."
+              % (len(todo), len(self.frames), len(subsets), self.n_workers,
+                 self.backend))
+        sys.stdout.flush()
+
+        encoder = None
+
+        if self.output is not None:
+            encoder = threading.Thread(target=self.encode)
+            encoder.start()
+
+        subset_queue = queue.Queue()
+        for subset in subsets:
+            subset_queue.put(subset)
+
+        threads = [
+            threading.Thread(target=self.worker, args=(subset_queue,))
+            for i in range(min(self.n_workers, len(subsets)))
+        ]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.condition:
+            self.rendering_done = True
+            self.condition.notify_all()
+
+        if encoder is not None:
+            encoder.join()
+
+        return sorted(self.failed)
+
+
+class StreamingFrameFarm(FrameFarm):
+    """FrameFarm som skickar ramarna till ffmpeg utan mellanliggande filer.
+
+    povray skriver varje ram som PPM till stdout (+O- +FP). Arbetaren
+    läser bilden ur pipen och lägger de råa RGB-bytesen i en
+    omordningsbuffert, som kodaren tömmer i ramordning till en enda
+    ffmpeg-process (-f rawvideo på stdin). En delmängd startas först när
+    dess första ram ligger högst buffer_size ramar efter nästa ram att
+    koda, vilket begränsar minnet. Med keep_frames sparas ramarna även
+    som PNG. Alla ramar renderas, befintliga PNG-filer används inte.
+    """
+
+    def __init__(self, *args, buffer_size=None, keep_frames=False,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if self.output is None:
+            raise ValueError("StreamingFrameFarm needs an output video")
+
+        self.buffer_size = buffer_size or 2*max(self.n_workers, 1)
+        self.keep_frames = keep_frames
+
+        self.buffer = {}
+        self.next_frame = self.frames[0] if self.frames else 0
+
+    def frame_done(self, frame):
+        return frame in self.buffer or frame < self.next_frame
+
+    def subset_command(self, subset):
+        return super().subset_command(subset) + ["+FP", "+O-"]
+
+    def encode_command(self):
+        return self.ffmpeg + [
+            "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", "%dx%d" % (self.width, self.height),
+            "-framerate", "%g" % self.framerate, "-i", "-",
+            "-pix_fmt", "yuv420p", self.output
+        ]
+
+    def frame_data(self, frame):
+        with self.condition:
+            data = self.buffer.pop(frame)
+            self.next_frame = frame + 1
+            self.condition.notify_all()
+
+        return data
+
+    def wait_for_window(self, frame):
+        """Vänta tills frame får plats i bufferten. False om kodningen har slutat."""
+
+        with self.condition:
+            while frame >= self.next_frame + self.buffer_size:
+                if self.encoding_done:
+                    return False
+                self.condition.wait()
+
+            return not self.encoding_done
+
+    def render_subset(self, subset):
+        start, end = subset
+
+        if not self.wait_for_window(start):
+            with self.condition:
+                self.failed.update(range(start, end + 1))
+            return
+
+        t0 = time.time()
+
+        log_filename = os.path.join(
+            self.log_dir, "frames_%d-%d.log" % (start, end)
+        )
+
+        frame = start
+
+        with open(log_filename, "w") as log:
+            try:
+                process = subprocess.Popen(
+                    self.subset_command(subset), stdout=subprocess.PIPE,
+                    stderr=log
+                )
+            except OSError as e:
+                log.write("Could not start povray: %s\n" % e)
+                process = None
+
+            if process is not None:
+                try:
+                    while frame <= end:
+                        image = read_ppm_stream(process.stdout)
+                        if image is None:
+                            break
+
+                        width, height, rgb = image
+
+                        if (width, height) != (self.width, self.height):
+                            raise ValueError(
+                                "Frame %d is %dx%d, expected %dx%d"
+                                % (frame, width, height, self.width,
+                                   self.height)
+                            )
+
+                        if self.keep_frames:
+                            write_png(self.frame_filename(frame), width,
+                                      height, rgb)
+
+                        with self.condition:
+                            self.buffer[frame] = rgb
+                            self.condition.notify_all()
+
+                        frame += 1
+                except ValueError as e:
+                    log.write("Could not read frame %d: %s\n" % (frame, e))
+                finally:
+                    process.stdout.close()
+                    returncode = process.wait()
+            else:
+                returncode = -1
+
+        failed = list(range(frame, end + 1))
+
+        with self.condition:
+            self.failed.update(failed)
+            self.condition.notify_all()
+
+        print("Frames %d-%d finished with status %d in %.1f s%s."
+              % (start, end, returncode, time.time() - t0,
+                 ", %d frames missing" % len(failed) if failed else ""))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Render the frames of a POV-Ray animation in parallel "
+        "and encode them with ffmpeg."
+    )
+    parser.add_argument("ini", help="POV-Ray .ini file, e.g. 2hbs.ini")
+    parser.add_argument(
+        "--output", default=None,
+        help="video file to encode, e.g. 2hbs.mp4 (default: no encoding)"
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.environ.get("SLURM_NTASKS", 1)),
+        help="number of povray processes at the same time "
+        "(default: $SLURM_NTASKS)"
+    )
+    parser.add_argument(
+        "--backend", choices=("local", "slurm"), default="local"
+    )
+    parser.add_argument(
+        "--chunk", type=int, default=1,
+        help="maximum number of frames per povray process (default: 1)"
+    )
+    parser.add_argument(
+        "--threads", type=int,
+        default=int(os.environ["SLURM_CPUS_PER_TASK"])
+        if "SLURM_CPUS_PER_TASK" in os.environ else None,
+        help="povray threads per process (+WT, default: $SLURM_CPUS_PER_TASK)"
+    )
+    parser.add_argument("--framerate", type=float, default=10)
+    parser.add_argument("--povray", default="povray")
+    parser.add_argument(
+        "--ffmpeg", default="ffmpeg",
+        help="ffmpeg command, e.g. 'bash ffmpeg.sh' to load its module first"
+    )
+    parser.add_argument(
+        "--povray-args", default="",
+        help="extra povray options, e.g. '+W1280 +H720'"
+    )
+    parser.add_argument("--log-dir", default="frame_logs")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="pipe the frames from povray to ffmpeg as raw RGB without "
+        "writing image files, needs --output"
+    )
+    parser.add_argument(
+        "--buffer", type=int, default=None,
+        help="with --stream, maximum number of frames rendered ahead of "
+        "the encoder (default: 2 x workers)"
+    )
+    parser.add_argument(
+        "--keep-frames", action="store_true",
+        help="with --stream, also save every frame as PNG"
+    )
+    args = parser.parse_args()
+
+    farm_args = (
+        args.ini, args.workers, args.backend, args.chunk, args.threads,
+        args.povray, args.ffmpeg, args.framerate, args.output,
+        shlex.split(args.povray_args), args.log_dir
+    )
+
+    if args.stream:
+        if args.output is None:
+            parser.error("--stream needs --output")
+        farm = StreamingFrameFarm(
+            *farm_args, buffer_size=args.buffer, keep_frames=args.keep_frames
+        )
+    else:
+        farm = FrameFarm(*farm_args)
+
+    t0 = time.time()
+    failed = farm.run()
+
+    print("Rendered frames %d-%d in %.1f s, %d missing."
+          % (farm.frames[0], farm.frames[-1], time.time() - t0, len(failed))
+          if farm.frames else "No frames to render.")
+
+    if args.output is not None:
+        print("Encoded %d frames to %s, ffmpeg exited with status %d."
+              % (farm.encoded, args.output, farm.encode_returncode))
+
+    if failed:
+        print("Missing frames: %s, see %s/frames_*.log"
+              % (" ".join(str(frame) for frame in failed), args.log_dir))
+        sys.exit(1)
+
+    if args.output is not None and farm.encode_returncode != 0:
+        sys.exit(1)
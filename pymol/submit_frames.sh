@@ -0,0 +1,27 @@
+#!/bin/bash
+
+#SBATCH -t 00:20:00
+#SBATCH -N 1
+#SBATCH --tasks-per-node=20
+#SBATCH -J tut_pymol_frames
+#SBATCH -o pymol_frames_%j.out
+#SBATCH -e pymol_frames_%j.err
+
+ml purge
+ml GCC/10.2.0
+ml POV-Ray/3.7.0.8
+
+#unzip 2hbs.zip
+
+# every frame is rendered by its own povray process started with srun,
+# 20 at a time. with --stream povray writes the frame to its stdout and
+# the raw pixels are passed in order through a single pipe to ffmpeg,
+# no image files are written. ffmpeg.sh loads the FFmpeg module in its
+# own environment.
+#
+# add --keep-frames to also save 2hbsNN.png, or drop --stream to render
+# to PNG files instead. frames that already have a complete PNG are then
+# skipped, so a job that ran out of time can simply be resubmitted.
+
+python3 frame_farm.py 2hbs.ini --backend slurm --ffmpeg "bash ffmpeg.sh" \
+    --stream --output 2hbs.mp4
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+#SBATCH -t 00:20:00
+#SBATCH -N 1
+#SBATCH --tasks-per-node=20
+#SBATCH -J tut_pymol
+#SBATCH -o pymol_%j.out
+#SBATCH -e pymol_%j.err
+
+ml purge
+ml GCC/10.2.0
+ml POV-Ray/3.7.0.8
+
+mkdir pymol_$SLURM_JOB_ID
+cd pymol_$SLURM_JOB_ID
+ln -s ../2hbs.zip 2hbs.zip
+ln -s ../2hbs.ini 2hbs.ini
+unzip 2hbs.zip
+
+# frames are rendered 20 at a time and piped as raw RGB to one ffmpeg
+# process, see ../pymol/frame_farm.py. no 2hbsNN.png files are written.
+
+python3 $SLURM_SUBMIT_DIR/../pymol/frame_farm.py 2hbs.ini --backend slurm \
+    --ffmpeg "bash $SLURM_SUBMIT_DIR/../pymol/ffmpeg.sh" \
+    --stream --output 2hbs.mp4